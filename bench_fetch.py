@@ -0,0 +1,289 @@
+## Benchmark the fetch.py parse/join/normalize stages on synthetic data.
+##
+##   python bench_fetch.py --scale 4 --jobs 4
+##
+## Generates realistically shaped inputs in a temporary data directory
+## (census DP tables, the 1976-2018 house results, CNN exit polls in both
+## the 'polls' and 2020 'questions' layouts, the monmouth poll and the
+## politico 2020 json) and times each stage, reporting input size, output
+## rows, throughput and peak memory.  No network is used.
+##
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# name, abbreviation, fips, districts (at scale 1)
+bench_states = [
+    ("Alabama", "AL", "01", 7), ("Alaska", "AK", "02", 1),
+    ("Arizona", "AZ", "04", 9), ("California", "CA", "06", 53),
+    ("Florida", "FL", "12", 27), ("Georgia", "GA", "13", 14),
+    ("Illinois", "IL", "17", 18), ("Massachusetts", "MA", "25", 9),
+    ("Minnesota", "MN", "27", 8), ("New York", "NY", "36", 27),
+    ("Ohio", "OH", "39", 16), ("Pennsylvania", "PA", "42", 18),
+    ("Texas", "TX", "48", 36), ("Vermont", "VT", "50", 1),
+    ("Wyoming", "WY", "56", 1), ("District of Columbia", "DC", "11", 1),
+]
+
+# exit poll questions and answers, as CNN words them
+bench_questions = {
+    "Gender": ["Male", "Female"],
+    "Age": ["18-29", "30-39", "40-49", "50-64", "65 and Older"],
+    "Income": ["Under $50K", "$50K-$100K", "$100K or more"],
+    "Race": ["White", "African-American", "Latino", "Asian", "Other race"],
+    "Education": ["HS or less", "College graduate", "Advanced degree"],
+    "Vote by Party ID": ["Democrat", "Republican", "Independent"],
+    "Are you a college graduate?": ["Yes", "No"],
+}
+
+
+# every district at scale, states with one district stay at large
+def bench_districts(scale):
+    for (name, abrv, fips, n) in bench_states:
+        n = n * scale if n > 1 else 1
+        for d in range(1, n + 1):
+            yield (name, abrv, fips, d, n)
+
+
+def census_name(name, d, n):
+    if n == 1:
+        return f"Congressional District (at Large) (116th Congress), {name}"
+    return f"Congressional District {d} (116th Congress), {name}"
+
+
+# one DP table per year and group, NAME + width variables with the
+# estimate/margin/percent columns the api returns + state,district
+def generate_census(fetch, rnd, scale, width):
+    for year in fetch.parse_census_years:
+        for group in ['DP02', 'DP03', 'DP05']:
+            cols = [f"{group}_{i:04d}{sfx}" for i in range(1, width + 1)
+                    for sfx in ['E', 'M', 'PE', 'PM']]
+            fname = f"{fetch.data_dir}{fetch.census_fileA}{year}{group}{fetch.census_fileB}"
+            with open(fname, 'w') as csvfile:
+                csvwriter = csv.writer(csvfile)
+                csvwriter.writerow(["NAME"] + cols + ["state", "congressional district"])
+                for (name, abrv, fips, d, n) in bench_districts(scale):
+                    vals = [str(rnd.randint(80, 99)) if c.endswith("PE")
+                            else str(rnd.randint(1000, 300000)) for c in cols]
+                    csvwriter.writerow([census_name(name, d, n)] + vals + [fips, f"{d:02d}"])
+
+
+# 1976-2018 house results, primary and general, three candidates a race
+def generate_house(fetch, rnd, scale):
+    fname = f"{fetch.data_dir}{fetch.congress_file}"
+    with open(fname, 'w') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(["year", "state", "state_po", "state_fips", "state_cen",
+                            "state_ic", "office", "district", "stage", "runoff",
+                            "special", "candidate", "party", "writein", "mode",
+                            "candidatevotes", "totalvotes", "unofficial", "version"])
+        for year in range(1976, 2020, 2):
+            for (name, abrv, fips, d, n) in bench_districts(scale):
+                if abrv == "DC":
+                    continue
+                cands = [("democrat", f"Dem {abrv}{d} {rnd.randint(0, 2)}"),
+                         ("republican", f"Rep {abrv}{d} {rnd.randint(0, 2)}"),
+                         ("libertarian", f"Lib {abrv}{d}")]
+                votes = [rnd.randint(0, 250000) for c in cands]
+                for stage in ["pri", "gen"]:
+                    for ((party, cand), v) in zip(cands, votes):
+                        csvwriter.writerow([year, name.upper(), abrv, fips, 0, 0,
+                                            "US House", 0 if n == 1 else d, stage,
+                                            "", False, cand, party, False, "total",
+                                            v, sum(votes), False, 20200113])
+
+
+# CNN exit polls, 'polls' layout before 2020 and 'questions' in 2020
+def generate_exit_polls(fetch, rnd):
+    for k in fetch.exitpolls:
+        fname = f"{fetch.data_dir}{fetch.exitpolls_fileA}{k}{fetch.exitpolls_fileB}"
+        if k.startswith("2020"):
+            questions = []
+            for (q, answers) in bench_questions.items():
+                questions.append({
+                    "question": q,
+                    "answers": [{"answer": a, "candidateAnswers": [
+                        {"candidateId": 1, "percentage": rnd.randint(20, 70)},
+                        {"candidateId": 2, "percentage": rnd.randint(20, 70)},
+                        {"candidateId": 3, "percentage": "-"}]}
+                        for a in answers]})
+            data = {"candidates": [{"candidateId": 1, "partyName": "Democratic"},
+                                   {"candidateId": 2, "partyName": "Republican"}],
+                    "questions": questions}
+        else:
+            polls = []
+            for (q, answers) in bench_questions.items():
+                polls.append({
+                    "question": q,
+                    "candidates": [{"id": 1, "fname": "Democrat", "party": "D"},
+                                   {"id": 2, "fname": "Republican", "party": "R"},
+                                   {"id": 3, "fname": "Other", "party": "O"}],
+                    "answers": [{"answer": a, "candidateanswers": [
+                        {"id": 1, "pct": str(rnd.randint(20, 70))},
+                        {"id": 2, "pct": str(rnd.randint(20, 70))},
+                        {"id": 3, "pct": "N/A"}]}
+                        for a in answers]})
+            data = {"polls": polls}
+        with open(fname, 'w') as outfile:
+            json.dump(data, outfile)
+
+
+# the monmouth poll, as pdftotext leaves it (see download_2020_house_polls)
+def generate_house_poll(fetch, rnd):
+    def pcts(n):
+        return [f"{rnd.randint(30, 60)}%" for i in range(n)]
+    fname = f"{fetch.data_dir}{fetch.poll_2020_house_file}"
+    with open(fname, 'w') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(["", "", "", "Male", "Female"])
+        csvwriter.writerow(["", "Democrat", ""] + pcts(2))
+        csvwriter.writerow(["", "Republican", ""] + pcts(2))
+        csvwriter.writerow(["", "Other", "", "", ""])
+        csvwriter.writerow([""] * 10 + ["Asn-Oth"])
+        csvwriter.writerow(["", "Democrat"] + pcts(9))
+        csvwriter.writerow(["", "Republican"] + pcts(9))
+        csvwriter.writerow(["", "Other", "", ""])
+        csvwriter.writerow(["", "", "", "", "Swing", "Clinton"])
+        csvwriter.writerow(["", "degree", "degree", ""])
+        csvwriter.writerow(["", "Democrat"] + pcts(2))
+        csvwriter.writerow(["", "Republican"] + pcts(2))
+        csvwriter.writerow(["", "Other", "", ""])
+
+
+# politico 2020 house results and metadata
+def generate_politico(fetch, rnd, scale):
+    races = []
+    meta = []
+    cid = 0
+    for (name, abrv, fips, d, n) in bench_districts(scale):
+        if abrv == "DC":
+            continue
+        raceid = f"{fips}{d:03d}"
+        cands = []
+        mcands = []
+        for party in ["dem", "gop", "lib"]:
+            cid += 1
+            cands.append({"candidateID": str(cid), "vote": rnd.randint(0, 300000)})
+            mcands.append({"candidateID": str(cid), "party": party,
+                           "incumbent": rnd.random() < 0.3})
+        races.append({"raceid": raceid, "stateFips": fips,
+                      "district": "00" if n == 1 else f"{d:02d}",
+                      "candidates": cands})
+        meta.append({"raceid": raceid, "holdingParty": rnd.choice(["dem", "gop", "none"]),
+                     "candidates": mcands})
+    with open(f"{fetch.data_dir}{fetch.results_2020hr_file}", 'w') as outfile:
+        json.dump({"races": races}, outfile)
+    with open(f"{fetch.data_dir}{fetch.results_2020hm_file}", 'w') as outfile:
+        json.dump(meta, outfile)
+
+
+def generate_all(fetch, scale, width, seed):
+    rnd = random.Random(seed)
+    generate_census(fetch, rnd, scale, width)
+    generate_house(fetch, rnd, scale)
+    generate_exit_polls(fetch, rnd)
+    generate_house_poll(fetch, rnd)
+    generate_politico(fetch, rnd, scale)
+
+
+# lines in a file (rows for the csv ones)
+def count_lines(fname):
+    if not os.path.exists(fname):
+        return 0
+    with open(fname, 'rb') as infile:
+        return sum(1 for line in infile)
+
+
+# remove the caches a stage leaves next to its inputs (the congress
+# index pickle), so every repeat times the cold scan rather than a cache
+# load.  The npz copies of the inputs stay, the stage before writes them.
+def drop_input_caches(fetch, inputs):
+    for f in inputs:
+        fcache = f"{f}{fetch.congress_index_suffix}"
+        if os.path.exists(fcache):
+            os.remove(fcache)
+
+
+# time every non-download stage of the fetch.py pipeline
+def bench_stages(fetch, repeat, trace_memory):
+    results = []
+    for st in fetch.pipeline_stages():
+        if st['name'].startswith("download_"):
+            continue
+        in_bytes = sum(os.path.getsize(f) for f in st['inputs'] if os.path.exists(f))
+        best = None
+        peak = None
+        for i in range(repeat):
+            drop_input_caches(fetch, st['inputs'])
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            st['func']()
+            elapsed = time.perf_counter() - start
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if best is None or elapsed < best:
+                best = elapsed
+        out_rows = sum(count_lines(f) for f in st['outputs'])
+        results.append({'stage': st['name'], 'seconds': best,
+                        'input_mb': in_bytes / 1e6, 'output_rows': out_rows,
+                        'mb_per_s': in_bytes / 1e6 / best,
+                        'rows_per_s': out_rows / best,
+                        'peak_mb': None if peak is None else peak / 1e6})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the fetch.py stages on synthetic data")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="multiply the number of districts per state")
+    parser.add_argument("--width", type=int, default=100,
+                        help="variables per census DP table (4 columns each)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per stage (each without the previous run's caches), "
+                             "the fastest is reported")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processes for the per-year work (fetch.jobs)")
+    parser.add_argument("--table-format", default="csv", choices=["csv", "npz"],
+                        help="fetch.table_format")
+    parser.add_argument("--memory", action="store_true",
+                        help="trace peak python memory per stage (slower)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # fetch.py wants data/ under the current directory
+        os.chdir(tmpdir)
+        os.mkdir("data")
+        import fetch
+        fetch.jobs = args.jobs
+        fetch.table_format = args.table_format
+
+        start = time.perf_counter()
+        generate_all(fetch, args.scale, args.width, args.seed)
+        print(f"generated data in {time.perf_counter() - start:.1f}s")
+
+        results = bench_stages(fetch, args.repeat, args.memory)
+        os.chdir(here)
+
+    print(f"{'stage':28s} {'seconds':>8s} {'in MB':>8s} {'out rows':>9s} "
+          f"{'MB/s':>8s} {'rows/s':>10s} {'peak MB':>8s}")
+    for r in results:
+        peak = "" if r['peak_mb'] is None else f"{r['peak_mb']:8.1f}"
+        print(f"{r['stage']:28s} {r['seconds']:8.3f} {r['input_mb']:8.1f} "
+              f"{r['output_rows']:9d} {r['mb_per_s']:8.1f} {r['rows_per_s']:10.0f} {peak:>8s}")
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            json.dump({'args': vars(args), 'stages': results}, outfile, indent=1)
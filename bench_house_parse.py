@@ -0,0 +1,45 @@
+## Compare the get_house_results html backends on saved politico pages.
+##
+##   python bench_house_parse.py data/pages/*.html
+##
+## save pages first with eg
+##   curl -o data/pages/california.html https://www.politico.com/2020-election/results/california/house/
+##
+
+import argparse
+import time
+
+import get_house_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark house page parsing backends")
+    parser.add_argument("pages", nargs="+", help="saved politico house pages")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="times to parse every page per backend")
+    args = parser.parse_args()
+
+    pages = []
+    for fname in args.pages:
+        with open(fname, 'rb') as infile:
+            pages.append(infile.read())
+
+    backends = ["full", "strained"]
+    rows = {}
+    for backend in backends:
+        best = None
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            rows[backend] = [get_house_results.house_page_rows(p, backend) for p in pages]
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        nrows = sum(len(r) for r in rows[backend])
+        print(f"{backend:10s} {best:8.3f}s for {len(pages)} pages, "
+              f"{best / len(pages) * 1000:8.1f}ms/page, {nrows} rows")
+    print(f"strained parser: {get_house_results.strained_parser}")
+
+    if rows["full"] != rows["strained"]:
+        for fname, a, b in zip(args.pages, rows["full"], rows["strained"]):
+            if a != b:
+                print(f"MISMATCH in {fname}")
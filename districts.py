@@ -0,0 +1,123 @@
+## District name parsing shared by fetch.py, join.py and get_house_results.py
+##
+## census names:   "Congressional District 3 (116th Congress), California"
+##                 "Congressional District (at Large) (116th Congress), Alaska"
+## politico names: "California's 3rd district"
+##                 "Alaska's At-large district"
+##
+## Names are parsed with precompiled patterns and memoized, since the same
+## few hundred names come back for every census file and every scrape.
+##
+
+import re
+from functools import lru_cache
+
+##https://gist.github.com/rogerallen/1583593
+state_abbrev = {
+    'Alabama': 'AL',
+    'Alaska': 'AK',
+    'American Samoa': 'AS',
+    'Arizona': 'AZ',
+    'Arkansas': 'AR',
+    'California': 'CA',
+    'Colorado': 'CO',
+    'Connecticut': 'CT',
+    'Delaware': 'DE',
+    'District of Columbia': 'DC',
+    'Florida': 'FL',
+    'Georgia': 'GA',
+    'Guam': 'GU',
+    'Hawaii': 'HI',
+    'Idaho': 'ID',
+    'Illinois': 'IL',
+    'Indiana': 'IN',
+    'Iowa': 'IA',
+    'Kansas': 'KS',
+    'Kentucky': 'KY',
+    'Louisiana': 'LA',
+    'Maine': 'ME',
+    'Maryland': 'MD',
+    'Massachusetts': 'MA',
+    'Michigan': 'MI',
+    'Minnesota': 'MN',
+    'Mississippi': 'MS',
+    'Missouri': 'MO',
+    'Montana': 'MT',
+    'Nebraska': 'NE',
+    'Nevada': 'NV',
+    'New Hampshire': 'NH',
+    'New Jersey': 'NJ',
+    'New Mexico': 'NM',
+    'New York': 'NY',
+    'North Carolina': 'NC',
+    'North Dakota': 'ND',
+    'Northern Mariana Islands':'MP',
+    'Ohio': 'OH',
+    'Oklahoma': 'OK',
+    'Oregon': 'OR',
+    'Pennsylvania': 'PA',
+    'Puerto Rico': 'PR',
+    'Rhode Island': 'RI',
+    'South Carolina': 'SC',
+    'South Dakota': 'SD',
+    'Tennessee': 'TN',
+    'Texas': 'TX',
+    'Utah': 'UT',
+    'Vermont': 'VT',
+    'Virgin Islands': 'VI',
+    'Virginia': 'VA',
+    'Washington': 'WA',
+    'West Virginia': 'WV',
+    'Wisconsin': 'WI',
+    'Wyoming': 'WY'
+}
+
+
+census_state_re = re.compile(r", (.*)$")
+census_district_re = re.compile(r"^Congressional District (\d+) ")
+politico_at_large_re = re.compile(r"(.*)'s? At-large district")
+politico_district_re = re.compile(r"(.*)'s? (\d+)(\w+) district")
+
+
+def state_to_abrv(name):
+    return state_abbrev[name]
+
+
+# census name -> (state abbreviation, district), district is 1 for at large
+@lru_cache(maxsize=None)
+def parse_census_name(name):
+    dist, state = (1, "")
+    s = census_state_re.search(name)
+    if s:
+        state = s.group(1)
+    else:
+        print("ERROR: unable to parse district %s" % name)
+    d = census_district_re.search(name)
+    if d:
+        dist = d.group(1)
+    return (state_to_abrv(state), dist)
+
+
+# politico name -> (state abbreviation, district), district is 1 for at large
+# and both are None if the name does not parse
+@lru_cache(maxsize=None)
+def parse_politico_name(district_name):
+    m = politico_at_large_re.match(district_name)
+    state, district = None, None
+    if m:
+        state = state_abbrev[m.group(1)]
+        district = 1
+    else:
+        m = politico_district_re.match(district_name)
+        if m:
+            state = state_abbrev[m.group(1)]
+            district = m.group(2)
+    return state, district
+
+
+# "ST-D" key of every census name in a pandas Series at once, the same as
+# f"{st}-{d}" from parse_census_name
+def census_name_keys(names):
+    states = names.str.extract(census_state_re, expand=False).map(state_abbrev)
+    dists = names.str.extract(census_district_re, expand=False).fillna("1")
+    return states + "-" + dists
@@ -0,0 +1,408 @@
+## Shared download engine for the fetch scripts.
+##
+## - one pooled requests session (keep-alive) for every download
+## - bounded number of downloads in flight at once
+## - per-host minimum delay between requests
+## - retries with backoff on connection errors and 429/5xx
+## - progress line per finished download
+## - conditional requests (ETag/Last-Modified) against files already on disk
+## - streaming to disk with atomic rename, checksums and resumed downloads
+## - running count of bytes downloaded, for instrumentation
+## - record/replay of responses as fixture files, and redirecting every
+##   request to a local stand-in server (standin_server.py)
+##
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+
+# max downloads in flight at once
+max_workers = 8
+
+# retries per request, sleeping backoff_factor * 2^n between them
+max_retries = 4
+backoff_factor = 0.5
+
+# seconds to wait for a server to connect/respond
+timeout = 60
+
+# min seconds between request starts to the same host
+host_delay = {
+    'www.politico.com': 0.5,
+    'data.cnn.com': 0.2,
+    'dataverse.harvard.edu': 0.2,
+}
+default_host_delay = 0.1
+
+# print a line per finished download
+show_progress = True
+
+# json file keeping the validators (ETag/Last-Modified) of each url
+# downloaded, so existing files can be revalidated with a conditional
+# request instead of downloaded again.  None disables it.
+cache_file = None
+
+# returned by download_all for a file the server says has not changed
+NOT_MODIFIED = "not modified"
+
+# bytes read at a time when streaming a download to disk
+chunk_size = 1 << 16
+
+# where responses come from:
+#   "live"   - the servers (or standin_url)
+#   "record" - the servers, saving every 200 response in fixture_dir
+#   "replay" - the fixtures in fixture_dir only, no network
+source_mode = "live"
+fixture_dir = "fixtures/"
+
+# base url of a standin_server.py, None to use the real servers.
+# https://host/path becomes {standin_url}/https/host/path
+standin_url = None
+
+
+_session = None
+_session_lock = threading.Lock()
+_host_next = {}
+_host_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+_bytes = 0
+_bytes_lock = threading.Lock()
+
+
+# session shared by all threads, with connection pooling and retries
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                          status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET", "HEAD"])
+            adapter = HTTPAdapter(pool_connections=max_workers,
+                                  pool_maxsize=max_workers,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+# block until the host of url may be hit again
+def wait_for_host(url):
+    host = urlsplit(url).netloc
+    delay = host_delay.get(host, default_host_delay)
+    with _host_lock:
+        now = time.monotonic()
+        start = max(now, _host_next.get(host, now))
+        _host_next[host] = start + delay
+    if start > now:
+        time.sleep(start - now)
+
+
+# response body bytes received so far, for instrumentation
+def count_bytes(n):
+    global _bytes
+    with _bytes_lock:
+        _bytes += n
+
+
+def bytes_downloaded():
+    with _bytes_lock:
+        return _bytes
+
+
+# url with its query params, as requested
+def full_url(url, params=None):
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+# fixture files of a url are {fixture_dir}{name}.body and .json
+def fixture_name(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+# url to request, on standin_url if set
+def source_url(url):
+    if standin_url is None:
+        return url
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{standin_url.rstrip('/')}/{parts.scheme}/{parts.netloc}{parts.path}{query}"
+
+
+def record_fixture(url, response):
+    os.makedirs(fixture_dir, exist_ok=True)
+    fname = f"{fixture_dir}{fixture_name(url)}"
+    headers = {k: response.headers[k] for k in
+               ['Content-Type', 'ETag', 'Last-Modified'] if k in response.headers}
+    with open(f"{fname}.body.tmp", 'wb') as outfile:
+        outfile.write(response.content)
+    os.replace(f"{fname}.body.tmp", f"{fname}.body")
+    with open(f"{fname}.json", 'w') as outfile:
+        json.dump({'url': url, 'status': response.status_code,
+                   'headers': headers}, outfile, indent=1)
+
+
+# response saved by record_fixture
+def replay_fixture(url):
+    fname = f"{fixture_dir}{fixture_name(url)}"
+    if not os.path.exists(f"{fname}.json"):
+        raise FileNotFoundError(f"no recorded fixture for {url}")
+    with open(f"{fname}.json", 'r') as infile:
+        meta = json.load(infile)
+    response = requests.Response()
+    with open(f"{fname}.body", 'rb') as infile:
+        response._content = infile.read()
+    response._content_consumed = True
+    response.status_code = meta['status']
+    response.reason = "OK"
+    response.url = url
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    response.encoding = get_encoding_from_headers(response.headers)
+    return response
+
+
+# rate limited GET on the shared session, or from the fixtures
+def get(url, **kwargs):
+    url = full_url(url, kwargs.pop('params', None))
+    stream = kwargs.get('stream', False)
+    if source_mode == "replay":
+        response = replay_fixture(url)
+    else:
+        if source_mode == "record":
+            # whole bodies, so there is something to record
+            kwargs['stream'] = False
+            kwargs['headers'] = {k: v for k, v in kwargs.get('headers', {}).items()
+                                 if k not in ['If-None-Match', 'If-Modified-Since',
+                                              'Range', 'If-Range']}
+        wait_for_host(url)
+        response = get_session().get(source_url(url), timeout=timeout, **kwargs)
+        if source_mode == "record" and response.status_code == 200:
+            record_fixture(url, response)
+    if not stream:
+        count_bytes(len(response.content))
+    return response
+
+
+# command line options choosing the source of the downloads
+def add_source_arguments(parser):
+    parser.add_argument("--source", choices=["live", "record", "replay"], default=source_mode,
+                        help="download live, live recording fixtures, or replay fixtures only")
+    parser.add_argument("--fixtures", default=fixture_dir,
+                        help="directory of recorded fixtures, include trailing /")
+    parser.add_argument("--standin", default=standin_url,
+                        help="send requests to this standin_server.py, eg http://localhost:8800")
+
+
+def use_source_arguments(args):
+    global source_mode, fixture_dir, standin_url
+    source_mode = args.source
+    fixture_dir = args.fixtures
+    standin_url = args.standin
+
+
+# validators of a response, for conditional and resumed requests
+def response_validators(response):
+    validators = {}
+    if 'ETag' in response.headers:
+        validators['etag'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        validators['last_modified'] = response.headers['Last-Modified']
+    return validators
+
+
+# validators saved for each url, loaded from cache_file on first use
+def load_cache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file, 'r') as infile:
+                _cache = json.load(infile)
+    return _cache
+
+
+# write the validators to cache_file, with _cache_lock held
+def save_cache():
+    tmpname = f"{cache_file}.tmp"
+    with open(tmpname, 'w') as outfile:
+        json.dump(load_cache(), outfile, indent=1, sort_keys=True)
+    os.replace(tmpname, cache_file)
+
+
+def remember_validators(url, response):
+    if cache_file is None:
+        return
+    validators = response_validators(response)
+    with _cache_lock:
+        cache = load_cache()
+        if validators:
+            cache[url] = validators
+        elif url in cache:
+            del cache[url]
+        else:
+            return
+        save_cache()
+
+
+# drop the validators of urls whose downloads were not kept after all, so
+# the next run does not take them as current
+def forget_validators(urls):
+    if cache_file is None:
+        return
+    with _cache_lock:
+        cache = load_cache()
+        if not any(url in cache for url in urls):
+            return
+        for url in urls:
+            cache.pop(url, None)
+        save_cache()
+
+
+# GET that is conditional on the saved validators when fname exists,
+# a 304 response means fname is still current
+def conditional_get(url, fname, headers={}):
+    headers = dict(headers)
+    if cache_file is not None and os.path.exists(fname):
+        with _cache_lock:
+            validators = load_cache().get(url, {})
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+    return get(url, headers=headers, stream=True)
+
+
+# download_all handler streaming the response body to fname.
+# The body goes to fname.part and is renamed to fname once complete (and
+# matching sha256, if given), so fname is never left half written.  With
+# resume, a .part left by an interrupted download is continued with a
+# range request if the server still has the same file.
+class StreamToFile:
+    def __init__(self, fname, sha256=None, resume=False):
+        self.fname = fname
+        self.partname = f"{fname}.part"
+        self.sha256 = sha256
+        self.resume = resume
+
+    def part_validators(self):
+        fmeta = f"{self.partname}.json"
+        if not os.path.exists(fmeta):
+            return {}
+        with open(fmeta, 'r') as infile:
+            return json.load(infile)
+
+    # extra request headers to resume the .part file
+    def headers(self):
+        if not self.resume or not os.path.exists(self.partname):
+            return {}
+        validators = self.part_validators()
+        if 'etag' in validators:
+            if_range = validators['etag']
+        elif 'last_modified' in validators:
+            if_range = validators['last_modified']
+        else:
+            return {}
+        return {'Range': f"bytes={os.path.getsize(self.partname)}-",
+                'If-Range': if_range}
+
+    # drop the .part and its validators, to start over
+    def discard(self):
+        for fname in [self.partname, f"{self.partname}.json"]:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def __call__(self, response):
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        if response.status_code == 206:
+            mode = 'ab'
+            with open(self.partname, 'rb') as infile:
+                for chunk in iter(lambda: infile.read(chunk_size), b""):
+                    digest.update(chunk)
+        else:
+            mode = 'wb'
+            if self.resume:
+                with open(f"{self.partname}.json", 'w') as outfile:
+                    json.dump(response_validators(response), outfile)
+        with open(self.partname, mode) as outfile:
+            for chunk in response.iter_content(chunk_size):
+                digest.update(chunk)
+                outfile.write(chunk)
+                count_bytes(len(chunk))
+        if self.sha256 is not None and digest.hexdigest() != self.sha256:
+            self.discard()
+            raise ValueError(f"sha256 mismatch for {self.fname}: {digest.hexdigest()}")
+        os.replace(self.partname, self.fname)
+        if os.path.exists(f"{self.partname}.json"):
+            os.remove(f"{self.partname}.json")
+        return self.fname
+
+
+# download many urls concurrently
+#   jobs: list of (url, handler), (url, handler, fname) or
+#         (url, handler, fname, conditional), handler(response) runs in a
+#         worker thread.  When fname is given its validators are
+#         remembered, and if it already exists (and conditional, the
+#         default) it is revalidated with a conditional request, the
+#         handler being skipped if it has not changed.
+# returns the handler results in job order (None where a download failed,
+# NOT_MODIFIED where the file was current)
+def download_all(jobs, workers=None):
+    if workers is None:
+        workers = max_workers
+    results = [None] * len(jobs)
+    if len(jobs) == 0:
+        return results
+
+    def run(url, handler, fname=None, conditional=True):
+        headers = handler.headers() if hasattr(handler, 'headers') else {}
+        response = None
+        if 'Range' in headers:
+            response = get(url, headers=headers, stream=True)
+            # 416: the .part is already the whole file (or more), it was
+            # never renamed, so start over with a plain request
+            if response.status_code == 416:
+                response.close()
+                handler.discard()
+                response = None
+        if response is None:
+            if fname is None or not conditional:
+                response = get(url, stream=True)
+            else:
+                response = conditional_get(url, fname)
+        with response:
+            if response.status_code == 304:
+                return NOT_MODIFIED
+            result = handler(response)
+            if not isinstance(handler, StreamToFile):
+                count_bytes(len(response.content))
+        if fname is not None:
+            remember_validators(url, response)
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run, *job): i
+                   for i, job in enumerate(jobs)}
+        for n, future in enumerate(as_completed(futures)):
+            i = futures[future]
+            url = jobs[i][0]
+            try:
+                results[i] = future.result()
+                if show_progress:
+                    status = " (not modified)" if results[i] is NOT_MODIFIED else ""
+                    print(f"[{n+1}/{len(jobs)}] {url}{status}")
+            except Exception as e:
+                print(f"ERROR downloading: {url} ({e})")
+    return results
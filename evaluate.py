@@ -0,0 +1,198 @@
+## Leave-one-cycle-out evaluation of classifiers predicting the house winner.
+##
+##   python evaluate.py --jobs 4
+##   python evaluate.py --models logistic sk_forest --features race_pref age_pref
+##
+## Builds the feature matrix once (features.load_features), then for every
+## model and every cycle fits on the other cycles and scores the held out
+## one, the (model, fold) fits running in a process pool.  Fitted models
+## are cached in data/models/ by a hash of the model config, features,
+## training data and model code (this file, and the sklearn version), so
+## re-running after changing one model or feature only refits what
+## changed.  The sklearn models are optional, they are skipped
+## when sklearn is not installed.
+##
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+import features
+import poststrat
+
+data_dir = "data/"
+model_dir = "models/"
+evaluation_file = "evaluation.csv"
+
+# name: (kind, params), kind is one of ours or an sklearn class path
+models = {
+    'prevparty': ('sign', {'column': 'prevparty_d'}),
+    'poststrat': ('sign', {'column': 'pred_margin'}),
+    'logistic': ('logistic', {'l2': 1.0}),
+    'sk_logistic': ('sklearn.linear_model.LogisticRegression', {'max_iter': 1000}),
+    'sk_forest': ('sklearn.ensemble.RandomForestClassifier',
+                  {'n_estimators': 200, 'random_state': 0}),
+    'sk_boosting': ('sklearn.ensemble.GradientBoostingClassifier', {'random_state': 0}),
+}
+
+# default features, the preferences of every group and dimension, but
+# for the dimensions some year has no polls for (their prefs are 0 there)
+default_features = ([f"{c}_pref" for (pop, gs) in poststrat.complete_dimensions().values()
+                     for (c, p) in gs] +
+                    [features.dimension_pref[d] for d in poststrat.complete_dimensions()] +
+                    ['incumbent', 'prevparty_d', 'pred_margin'])
+
+
+# predicts a dem win where one feature is positive
+class SignOf:
+    def __init__(self, names, column):
+        self.index = names.index(column)
+
+    def fit(self, X, y):
+        return self
+
+    def predict(self, X):
+        return (X[:, self.index] > 0).astype(int)
+
+
+# l2 regularized logistic regression on standardized features, fitted
+# with newton steps (numpy only)
+class Logistic:
+    def __init__(self, names, l2=1.0, iterations=25):
+        self.l2 = l2
+        self.iterations = iterations
+
+    def fit(self, X, y):
+        self.mean = X.mean(axis=0)
+        self.sd = np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+        Z = np.hstack([np.ones((len(X), 1)), (X - self.mean) / self.sd])
+        w = np.zeros(Z.shape[1])
+        reg = np.full(Z.shape[1], self.l2)
+        reg[0] = 0
+        for i in range(self.iterations):
+            p = 1 / (1 + np.exp(-np.clip(Z @ w, -30, 30)))
+            grad = Z.T @ (p - y) + reg * w
+            hess = (Z * (p * (1 - p))[:, None]).T @ Z + np.diag(reg)
+            step = np.linalg.solve(hess, grad)
+            w -= step
+            if np.abs(step).max() < 1e-8:
+                break
+        self.w = w
+        return self
+
+    def predict(self, X):
+        Z = np.hstack([np.ones((len(X), 1)), (X - self.mean) / self.sd])
+        return (Z @ self.w > 0).astype(int)
+
+
+our_models = {'sign': SignOf, 'logistic': Logistic}
+
+
+# new model of a config, None if it needs a missing package
+def make_model(kind, params, names):
+    if kind in our_models:
+        return our_models[kind](names, **params)
+    (module, _, cls) = kind.rpartition('.')
+    try:
+        return getattr(importlib.import_module(module), cls)(**params)
+    except ImportError:
+        return None
+
+
+# rows and columns to evaluate on: contested races (both a dem and a rep
+# with votes, as in poststrat), with the features
+def feature_matrix(df, names):
+    df = df.assign(prevparty_d=np.select([df['prevparty'] == 'd', df['prevparty'] == 'r'],
+                                         [1.0, -1.0], 0.0),
+                   pred_margin=poststrat.predict_all(df))
+    df = df[(df['dem'] > 0) & (df['rep'] > 0)]
+    X = df[names].to_numpy(dtype=float)
+    y = (df['dem'] > df['rep']).to_numpy(dtype=int)
+    return X, y, df['year'].to_numpy()
+
+
+# version of the model code: this file, and sklearn's for its models
+def code_version(kind):
+    with open(__file__, 'rb') as infile:
+        version = hashlib.sha256(infile.read()).hexdigest()
+    if kind not in our_models:
+        try:
+            version = f"{version} sklearn {importlib.import_module('sklearn').__version__}"
+        except ImportError:
+            pass
+    return version
+
+
+# cache key of a fit, from the config, the training data and the code
+def fit_key(name, kind, params, names, X, y):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([name, kind, params, names, code_version(kind)],
+                             sort_keys=True).encode('utf-8'))
+    digest.update(X.tobytes())
+    digest.update(y.tobytes())
+    return digest.hexdigest()
+
+
+# fit (or load) one model on one fold and score the held out cycle
+def run_fold(name, kind, params, names, X, y, years, year):
+    train = years != year
+    test = years == year
+    key = fit_key(name, kind, params, names, X[train], y[train])
+    fcache = f"{data_dir}{model_dir}{key}.pickle"
+    cached = os.path.exists(fcache)
+    if cached:
+        with open(fcache, 'rb') as infile:
+            (model, fit_seconds) = pickle.load(infile)
+    else:
+        model = make_model(kind, params, names)
+        if model is None:
+            return None
+        start = time.perf_counter()
+        model.fit(X[train], y[train])
+        fit_seconds = time.perf_counter() - start
+        with open(f"{fcache}.{os.getpid()}.tmp", 'wb') as outfile:
+            pickle.dump((model, fit_seconds), outfile)
+        os.replace(f"{fcache}.{os.getpid()}.tmp", fcache)
+    accuracy = (model.predict(X[test]) == y[test]).mean() if test.any() else float('nan')
+    return {'model': name, 'holdout': int(year), 'train_rows': int(train.sum()),
+            'test_rows': int(test.sum()), 'accuracy': accuracy,
+            'fit_seconds': fit_seconds, 'cached': cached}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Leave-one-cycle-out evaluation of the house models")
+    parser.add_argument("--models", nargs="+", default=list(models.keys()),
+                        choices=list(models.keys()))
+    parser.add_argument("--features", nargs="+", default=default_features,
+                        help="feature columns (see features.py)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processes to fit the folds in")
+    args = parser.parse_args()
+
+    df = features.load_features()
+    X, y, years = feature_matrix(df, args.features)
+    os.makedirs(f"{data_dir}{model_dir}", exist_ok=True)
+
+    tasks = [(name, models[name][0], models[name][1], args.features, X, y, years, year)
+             for name in args.models for year in sorted(set(years))]
+    if args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            results = list(pool.map(run_fold, *zip(*tasks)))
+    else:
+        results = [run_fold(*t) for t in tasks]
+
+    skipped = sorted({t[0] for (t, r) in zip(tasks, results) if r is None})
+    if skipped:
+        print(f"WARNING: skipping {', '.join(skipped)}, sklearn is not installed")
+    report = pd.DataFrame([r for r in results if r is not None])
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(report.groupby('model', sort=False)[['accuracy', 'fit_seconds']].mean()
+          .to_string(float_format=lambda v: f"{v:.3f}"))
+    report.to_csv(f"{data_dir}{evaluation_file}", index=False)
@@ -0,0 +1,141 @@
+## Share and preference features of final_data_h.csv for the models.
+##
+##   import features
+##   df = features.load_features()
+##
+## For every demographic group of poststrat.dimensions:
+##   <group>_pct   share of the group in its dimension's population, 0-100
+##   <group>_pref  the share times the group's poll margin / 100
+## and per dimension the sum of its <group>_pref (voteage_sex_pref,
+## race_pref, ...), plus demrepdiff and dem_win from the results (NaN
+## for a race without votes, and dem_win also for a tie, as the notebook
+## had them).  The frame is cached next to the input, keyed by the input's sha256,
+## so it is only recomputed when final_data_h.csv changes.
+##
+## load_interim_features does the same for the per-year interim files,
+## which still have the finer race groups the EDA notebook plots
+## (race_black_pct, race_other_pref, ...).
+##
+
+import argparse
+import os.path
+import pickle
+import numpy as np
+import pandas as pd
+
+import fetch
+import poststrat
+
+# files are under fetch.data_dir
+final_file = "final_data_h.csv"
+features_suffix = ".features.pickle"
+interim_years = [2012, 2014, 2016, 2018]
+interim_features_file = "interim_data_h.features.pickle"
+
+# bump when the features change, so old caches are not used
+features_version = 2
+
+# name of the summed preference of each dimension
+dimension_pref = {
+    'gender': 'voteage_sex_pref',
+    'age': 'age_pref',
+    'income': 'inc_pref',
+    'race': 'race_pref',
+    'education': 'ed_pref',
+}
+
+# groups of the interim files (fetch.join_house_data) before the races
+# are merged to white/nonwhite, race_other being the rest of race_pop.
+# 2020 only has Race,Non-White, so these are for interim_years.
+interim_dimensions = {
+    'gender': poststrat.dimensions['gender'],
+    'race': ('race_pop', [('race_white', "Race,White"),
+                          ('race_black', "Race,Black"),
+                          ('race_asian', "Race,Asian"),
+                          ('race_hisp', "Race,Latino"),
+                          ('race_other', "Race,Other")]),
+}
+
+
+# the features of df (final_data_h rows), as a new frame with df's columns
+#   dims: the groups, poststrat.dimensions by default
+def build_features(df, dims=None):
+    dims = poststrat.dimensions if dims is None else dims
+    groups = [(pop, c, p) for (pop, gs) in dims.values() for (c, p) in gs]
+    counts = df[[c for (pop, c, p) in groups]].to_numpy(dtype=float)
+    pops = df[[pop for (pop, c, p) in groups]].to_numpy(dtype=float)
+    polls = df[[p for (pop, c, p) in groups]].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(pops > 0, counts / pops * 100, 0.0)
+    pref = pct * polls / 100
+
+    # sum the prefs of each dimension's block of columns
+    starts = np.cumsum([0] + [len(gs) for (pop, gs) in dims.values()])[:-1]
+    dim_pref = np.add.reduceat(pref, starts, axis=1)
+
+    tot = df['tot'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        demrepdiff = np.where(tot > 0, (df['dem'] - df['rep']).to_numpy(dtype=float) / tot * 100,
+                              np.nan)
+
+    names = [f"{c}_pct" for (pop, c, p) in groups] + \
+            [f"{c}_pref" for (pop, c, p) in groups] + \
+            [dimension_pref[d] for d in dims]
+    feats = pd.DataFrame(np.hstack([pct, pref, dim_pref]), columns=names, index=df.index)
+    feats['demrepdiff'] = demrepdiff
+    feats['dem_win'] = np.where(demrepdiff != 0, (np.sign(demrepdiff) + 1) / 2, np.nan)
+    return pd.concat([df, feats], axis=1)
+
+
+# frame built by build(), from fcache when none of fnames has changed
+def cached(fnames, fcache, build, refresh=False):
+    key = (features_version, [fetch.file_hash(f) for f in fnames])
+    if not refresh and os.path.exists(fcache):
+        with open(fcache, 'rb') as infile:
+            (cached_key, df) = pickle.load(infile)
+        if cached_key == key:
+            return df
+
+    df = build()
+    with open(f"{fcache}.tmp", 'wb') as outfile:
+        pickle.dump((key, df), outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{fcache}.tmp", fcache)
+    return df
+
+
+# final_data_h with its features, from the cache when fname is unchanged
+def load_features(fname=None, refresh=False):
+    if fname is None:
+        fname = f"{fetch.data_dir}{final_file}"
+    return cached([fname], f"{fname}{features_suffix}",
+                  lambda: build_features(pd.read_csv(fname, keep_default_na=False)),
+                  refresh)
+
+
+# the interim data of years (fetch.read_interim_year) with the features
+# of interim_dimensions, from the cache when the files are unchanged
+def load_interim_features(years=None, refresh=False):
+    years = interim_years if years is None else years
+    fnames = [f"{fetch.data_dir}{fetch.interim_fileprefix}{year}h{fetch.interim_filesuffix}"
+              for year in years]
+
+    def build():
+        df = pd.concat([fetch.read_interim_year(year) for year in years], ignore_index=True)
+        # read_interim_year leaves the columns up to prevparty as text
+        for c in ['year', 'district', 'dem', 'rep', 'tot']:
+            df[c] = pd.to_numeric(df[c])
+        (pop, groups) = interim_dimensions['race']
+        named = [c for (c, p) in groups if c != 'race_other']
+        df['race_other'] = (df[pop] - df[named].sum(axis=1)).clip(lower=0)
+        return build_features(df, interim_dimensions)
+
+    return cached(fnames, f"{fetch.data_dir}{interim_features_file}", build, refresh)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cached feature frame of final_data_h")
+    parser.add_argument("--input", default=f"{fetch.data_dir}{final_file}")
+    parser.add_argument("--refresh", action="store_true", help="rebuild even if cached")
+    args = parser.parse_args()
+    df = load_features(args.input, args.refresh)
+    print(f"{len(df)} rows, {len(df.columns)} columns in {args.input}{features_suffix}")
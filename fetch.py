@@ -8,22 +8,44 @@
 ## - Exit polls by demographics
 ##
 
+import argparse
 import csv
+import hashlib
 import json
+import multiprocessing
+import numpy as np
 import os.path
+import pickle
 import re
-import requests
-import time
+import threading
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import districts
+import downloader
+import instrument
+import jsonio
+import poststrat
 
 # if should re-download everything, else skips existing files
 force_redownload = False
 
+# if should revalidate existing files with conditional requests, so only
+# the sources that changed on the server are downloaded again
+refresh_downloads = False
+
 # directory to save all results, include tailing /
 data_dir = "data/"
 if data_dir != "":
     assert os.path.isdir(data_dir) == True, f"Dir {data_dir} MUST exist"
 
+# ETag/Last-Modified of everything downloaded, for refresh_downloads
+downloader.cache_file = f"{data_dir}http_cache.json"
+
+# expected sha256 of downloaded files, checked when listed here
+#   eg {congress_file: "0f3a..."}
+download_sha256 = {}
+
 
 ### Global vars for data sources
 
@@ -40,11 +62,212 @@ census_fileB = ".csv"
 census_years = list(range(2009, 2020))
 census_groups = ['DP02', 'DP03', 'DP05']
 
+# census_batched: only download the census_fields_by_year variables, all
+# groups in one request per year, into one file per year instead of one
+# whole group(...) table per year and group
+census_batched = False
+census_urlD = "/acs/acs1/profile?get=NAME,"
+census_urlE = "&for=congressional%20district:*"
+# most variables the api allows in one request, besides NAME
+census_max_vars = 49
+
+# fields parsed from the census per year (parse_census_years)
+# the fields below are from these labels - for easier searching
+# CITIZEN, VOTING AGE POPULATION  or  SEX AND AGE + U.S. CITIZENSHIP STATUS
+# RACE
+# EDUCATIONAL ATTAINMENT
+# SEX AND AGE
+# INCOME AND BENEFITS
+census_fields_by_year = {
+    # https://api.census.gov/data/2019/acs/acs1/profile/variables.html
+    '2019': {'DP05_0087E': 'voteage_pop',
+             'DP05_0088E': 'voteage_m',
+             'DP05_0089E': 'voteage_f',
+             'DP05_0033E': 'race_pop',
+             'DP05_0037E': 'race_white',
+             'DP05_0065E': 'race_black',
+             'DP05_0067E': 'race_asian',
+             'DP05_0071E': 'race_hisp',
+             'DP02_0059E': 'ed_pop',
+             'DP02_0065E': 'ed_ba',
+             'DP02_0066E': 'ed_grdeg',
+             'DP05_0001E': 'age_pop',
+             'DP05_0009E': 'age_20_24',
+             'DP05_0010E': 'age_25_34',
+             'DP05_0011E': 'age_35_44',
+             'DP05_0012E': 'age_45_54',
+             'DP05_0013E': 'age_55_59',
+             'DP05_0014E': 'age_60_64',
+             'DP05_0021E': 'age_18_plus',
+             'DP05_0022E': 'age_21_plus',
+             'DP05_0024E': 'age_65_plus',
+             'DP03_0051E': 'inc_pop',
+             'DP03_0052E': 'inc_less_10',
+             'DP03_0053E': 'inc_10_14',
+             'DP03_0054E': 'inc_15_24',
+             'DP03_0055E': 'inc_25_34',
+             'DP03_0056E': 'inc_35_49',
+             'DP03_0057E': 'inc_50_74',
+             'DP03_0058E': 'inc_75_99',
+             'DP03_0059E': 'inc_100_149',
+             'DP03_0060E': 'inc_150_199',
+             'DP03_0061E': 'inc_200_plus',
+    },
+    # https://api.census.gov/data/2018/acs/acs1/profile/variables.html
+    '2018': {'DP05_0087E': 'voteage_pop',
+             'DP05_0088E': 'voteage_m',
+             'DP05_0089E': 'voteage_f',
+             'DP05_0033E': 'race_pop',
+             'DP05_0037E': 'race_white',
+             'DP05_0065E': 'race_black',
+             'DP05_0067E': 'race_asian',
+             'DP05_0071E': 'race_hisp',
+             'DP02_0058E': 'ed_pop',
+             'DP02_0064E': 'ed_ba',
+             'DP02_0065E': 'ed_grdeg',
+             'DP05_0001E': 'age_pop',
+             'DP05_0009E': 'age_20_24',
+             'DP05_0010E': 'age_25_34',
+             'DP05_0011E': 'age_35_44',
+             'DP05_0012E': 'age_45_54',
+             'DP05_0013E': 'age_55_59',
+             'DP05_0014E': 'age_60_64',
+             'DP05_0021E': 'age_18_plus',
+             'DP05_0022E': 'age_21_plus',
+             'DP05_0024E': 'age_65_plus',
+             'DP03_0051E': 'inc_pop',
+             'DP03_0052E': 'inc_less_10',
+             'DP03_0053E': 'inc_10_14',
+             'DP03_0054E': 'inc_15_24',
+             'DP03_0055E': 'inc_25_34',
+             'DP03_0056E': 'inc_35_49',
+             'DP03_0057E': 'inc_50_74',
+             'DP03_0058E': 'inc_75_99',
+             'DP03_0059E': 'inc_100_149',
+             'DP03_0060E': 'inc_150_199',
+             'DP03_0061E': 'inc_200_plus',
+    },
+    # https://api.census.gov/data/2016/acs/acs1/profile/variables.html
+    '2016': {'DP05_0082E': 'voteage_pop',
+             'DP05_0083E': 'voteage_m',
+             'DP05_0084E': 'voteage_f',
+             'DP05_0028E': 'race_pop',
+             'DP05_0032E': 'race_white',
+             'DP05_0060E': 'race_black',
+             'DP05_0062E': 'race_asian',
+             'DP05_0066E': 'race_hisp',
+             'DP02_0058E': 'ed_pop',
+             'DP02_0064E': 'ed_ba',
+             'DP02_0065E': 'ed_grdeg',
+             'DP05_0001E': 'age_pop',
+             'DP05_0008E': 'age_20_24',
+             'DP05_0009E': 'age_25_34',
+             'DP05_0010E': 'age_35_44',
+             'DP05_0011E': 'age_45_54',
+             'DP05_0012E': 'age_55_59',
+             'DP05_0013E': 'age_60_64',
+             'DP05_0018E': 'age_18_plus',
+             'DP05_0019E': 'age_21_plus',
+             'DP05_0021E': 'age_65_plus',
+             'DP03_0051E': 'inc_pop',
+             'DP03_0052E': 'inc_less_10',
+             'DP03_0053E': 'inc_10_14',
+             'DP03_0054E': 'inc_15_24',
+             'DP03_0055E': 'inc_25_34',
+             'DP03_0056E': 'inc_35_49',
+             'DP03_0057E': 'inc_50_74',
+             'DP03_0058E': 'inc_75_99',
+             'DP03_0059E': 'inc_100_149',
+             'DP03_0060E': 'inc_150_199',
+             'DP03_0061E': 'inc_200_plus',
+    },
+    # https://api.census.gov/data/2014/acs/acs1/profile/variables.html
+    '2014': {#'DP05_0082E': 'voteage_pop',
+             #'DP05_0083E': 'voteage_m',
+             #'DP05_0084E': 'voteage_f',
+             'DP05_0001E': 'allage_pop',
+             'DP05_0002E': 'allage_m',
+             'DP05_0003E': 'allage_f',
+             'DP05_0018E': 'allage_18plus',
+             'DP02_0095PE': 'allage_citzenpct',
+             'DP05_0028E': 'race_pop',
+             'DP05_0032E': 'race_white',
+             'DP05_0060E': 'race_black',
+             'DP05_0062E': 'race_asian',
+             'DP05_0066E': 'race_hisp',
+             'DP02_0058E': 'ed_pop',
+             'DP02_0064E': 'ed_ba',
+             'DP02_0065E': 'ed_grdeg',
+             'DP05_0001E': 'age_pop',
+             'DP05_0008E': 'age_20_24',
+             'DP05_0009E': 'age_25_34',
+             'DP05_0010E': 'age_35_44',
+             'DP05_0011E': 'age_45_54',
+             'DP05_0012E': 'age_55_59',
+             'DP05_0013E': 'age_60_64',
+             'DP05_0018E': 'age_18_plus',
+             'DP05_0019E': 'age_21_plus',
+             'DP05_0021E': 'age_65_plus',
+             'DP03_0051E': 'inc_pop',
+             'DP03_0052E': 'inc_less_10',
+             'DP03_0053E': 'inc_10_14',
+             'DP03_0054E': 'inc_15_24',
+             'DP03_0055E': 'inc_25_34',
+             'DP03_0056E': 'inc_35_49',
+             'DP03_0057E': 'inc_50_74',
+             'DP03_0058E': 'inc_75_99',
+             'DP03_0059E': 'inc_100_149',
+             'DP03_0060E': 'inc_150_199',
+             'DP03_0061E': 'inc_200_plus',
+    },
+    # https://api.census.gov/data/2012/acs/acs1/profile/variables.html
+    '2012': {#'DP05_0082E': 'voteage_pop',
+             #'DP05_0083E': 'voteage_m',
+             #'DP05_0084E': 'voteage_f',
+             'DP05_0001E': 'allage_pop',
+             'DP05_0002E': 'allage_m',
+             'DP05_0003E': 'allage_f',
+             'DP05_0018E': 'allage_18plus',
+             'DP02_0095PE': 'allage_citzenpct',
+             'DP05_0028E': 'race_pop',
+             'DP05_0032E': 'race_white',
+             'DP05_0060E': 'race_black',
+             'DP05_0062E': 'race_asian',
+             'DP05_0066E': 'race_hisp',
+             'DP02_0058E': 'ed_pop',
+             'DP02_0064E': 'ed_ba',
+             'DP02_0065E': 'ed_grdeg',
+             'DP05_0001E': 'age_pop',
+             'DP05_0008E': 'age_20_24',
+             'DP05_0009E': 'age_25_34',
+             'DP05_0010E': 'age_35_44',
+             'DP05_0011E': 'age_45_54',
+             'DP05_0012E': 'age_55_59',
+             'DP05_0013E': 'age_60_64',
+             'DP05_0018E': 'age_18_plus',
+             'DP05_0019E': 'age_21_plus',
+             'DP05_0021E': 'age_65_plus',
+             'DP03_0051E': 'inc_pop',
+             'DP03_0052E': 'inc_less_10',
+             'DP03_0053E': 'inc_10_14',
+             'DP03_0054E': 'inc_15_24',
+             'DP03_0055E': 'inc_25_34',
+             'DP03_0056E': 'inc_35_49',
+             'DP03_0057E': 'inc_50_74',
+             'DP03_0058E': 'inc_75_99',
+             'DP03_0059E': 'inc_100_149',
+             'DP03_0060E': 'inc_150_199',
+             'DP03_0061E': 'inc_200_plus',
+    },
+}
+
 
 # congress results
 # from https://dataverse.harvard.edu/dataset.xhtml?persistentId=doi:10.7910/DVN/IG0UN2
 congress_url = "https://dataverse.harvard.edu/api/access/datafile/3814252?format=original&gbrecs=true"
 congress_file = "1976-2018-house2.csv"
+# index of the above built by load_house_index(), saved next to it
+congress_index_suffix = ".idx.pickle"
 
 # 2016 presidential results by congressional precinct
 # from https://dataverse.harvard.edu/dataset.xhtml?persistentId=doi:10.7910/DVN/LYWX3D
@@ -56,6 +279,27 @@ presidential_2016_file = "2016-precinct-president.csv"
 ## Obtained from R
 presidential_2012_file = "2012-precinct-president.csv"
 
+# precinct files by presidential year, for join_pres_data
+pres_years = [2012, 2016]
+pres_files = {2012: presidential_2012_file, 2016: presidential_2016_file}
+
+# columns of the precinct files
+pres_columns = {'state': 'state_postal', 'county': 'county_fips', 'precinct': 'precinct',
+                'district': 'district', 'party': 'party', 'votes': 'votes'}
+pres_dem_parties = ['democratic', 'democrat', 'democratic-farmer-labor']
+pres_rep_parties = ['republican']
+# the precinct files are not all valid utf-8
+pres_encoding = "latin-1"
+
+# optional precinct to congressional district crosswalk, columns
+#   state_postal,county_fips,precinct,district[,weight]
+# with weight the share of a split precinct's votes in the district.
+# Without it the district column of the precinct files is used.
+pres_crosswalk_file = "precinct-district-crosswalk.csv"
+
+# precinct rows read at a time
+pres_chunk_rows = 500000
+
 #### Not using this anymore, using per-district instead of per-county
 # 2000-2016 presidential results by county
 # from https://dataverse.harvard.edu/dataset.xhtml?persistentId=doi:10.7910/DVN/VOQCHQ
@@ -96,8 +340,9 @@ results_2020pr_urlA = "https://www.politico.com/2020-statewide-results/"
 results_2020pr_urlB = "/potus.json"
 results_2020pm_urlA = "https://www.politico.com/2020-statewide-metadata/"
 results_2020pm_urlB = "/potus.meta.json"
-results_2020pr_file = "2020_potus.json"
-results_2020pm_file = "2020_potus.meta.json"
+# json lines, one {"state": abrv, "data": politico json} per state
+results_2020pr_file = "2020_potus.jsonl"
+results_2020pm_file = "2020_potus.meta.jsonl"
 
 
 # 2020 pre-election polls presidential
@@ -120,12 +365,24 @@ parsed_fileprefix = "parsed_"
 exitpolls_parsed_fileB = ".csv"
 res2020_parsed_fileB = ".csv"
 
+# census years with fields listed in parse_census_districts
+parse_census_years = [2012,2014,2016,2018,2019]
+
+# house election years in the interim and final data
+house_years = [2012, 2014, 2016, 2018, 2020]
+
 interim_fileprefix = "interim_data_"
 interim_filesuffix = ".csv"
 
 final_fileprefix = "final_data_"
 final_filesuffix = ".csv"
 
+# parsed_, interim_ and final_ tables are always written as csv, and with
+# "npz" also as typed columns in a numpy file next to the csv, which the
+# next stages read instead of re-parsing the csv text
+table_format = "csv"
+table_binary_suffix = ".npz"
+
 
 
 ### FIPS data: (from wikipedia)
@@ -186,10 +443,159 @@ fips_to_state = {x[2]: x[1] for x in fips_state_data}
 
 
 
+### Per-year parallelism
+
+# processes for the per-year work of the parse, join and normalize stages
+jobs = 1
+
+# the module settings (every plain value global: file names, data_dir,
+# table_format, pres_chunk_rows, download_encoding, ...) for a pool
+# process, which does not see our changes to them unless it forks from us.
+# Workers run their years serially.
+def pool_settings():
+    settings = {k: v for (k, v) in globals().items()
+                if not k.startswith('_') and
+                isinstance(v, (str, int, float, bool, list, tuple, dict, type(None)))}
+    settings['jobs'] = 1
+    return settings
+
+def pool_init(settings):
+    globals().update(settings)
+
+# map func over the years (and any other args lists), in a process pool
+# when jobs > 1.  Results come back in args order either way.  From a
+# run_pipeline --parallel thread the pool is spawned, as forking while
+# other threads hold locks can deadlock the child.
+def map_years(func, *args):
+    if jobs > 1 and len(args[0]) > 1:
+        context = None
+        if threading.current_thread() is not threading.main_thread():
+            context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(jobs, len(args[0])),
+                                 mp_context=context,
+                                 initializer=pool_init,
+                                 initargs=(pool_settings(),)) as pool:
+            return list(pool.map(func, *args))
+    return list(map(func, *args))
+
+
+
+### Table storage
+
+# column as a typed array when every value round trips through the csv
+# text unchanged as an int or float, else as strings
+def typed_column(values):
+    strs = [str(v) for v in values]
+    for cast in [int, float]:
+        try:
+            typed = [cast(v) for v in strs]
+        except ValueError:
+            continue
+        if all(str(t) == v for t, v in zip(typed, strs)):
+            return np.array(typed)
+    return np.array(strs, dtype=str)
+
+
+# write rows (and optional header) to the csv fname, plus the typed
+# columns to fname.npz when table_format is "npz"
+def write_table(fname, rows, header=None):
+    with open(fname, 'w') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        if header is not None:
+            csvwriter.writerow(header)
+        for r in rows:
+            csvwriter.writerow(r)
+
+    fbin = f"{fname}{table_binary_suffix}"
+    ncols = len(rows[0]) if len(rows) > 0 else 0
+    if table_format != "npz" or any(len(r) != ncols for r in rows):
+        # stale typed copy would hide the new csv
+        if os.path.exists(fbin):
+            os.remove(fbin)
+        return
+    arrays = {f"c{i}": typed_column([r[i] for r in rows]) for i in range(ncols)}
+    arrays['ncols'] = np.array(ncols)
+    if header is not None:
+        arrays['header'] = np.array(header, dtype=str)
+    with open(fbin, 'wb') as outfile:
+        np.savez(outfile, **arrays)
+
+
+# read a table written by write_table as (header, rows), header is None
+# when has_header is False.  Uses the typed columns if they are at least
+# as new as the csv, values are then ints/floats rather than strings.
+def read_table(fname, has_header=True):
+    fbin = f"{fname}{table_binary_suffix}"
+    if os.path.exists(fbin) and \
+       os.path.getmtime(fbin) >= os.path.getmtime(fname):
+        with np.load(fbin, allow_pickle=False) as arrays:
+            header = arrays['header'].tolist() if 'header' in arrays else None
+            cols = [arrays[f"c{i}"].tolist() for i in range(int(arrays['ncols']))]
+        if has_header and header is not None:
+            return (header, [list(r) for r in zip(*cols)])
+        if not has_header and header is None:
+            return (None, [list(r) for r in zip(*cols)])
+
+    with open(fname, 'r') as csvfile:
+        rows = list(csv.reader(csvfile))
+    if has_header:
+        return (rows[0], rows[1:])
+    return (None, rows)
+
+
+
 ### Download data
 
+# should fname be downloaded (again)
+def want_download(fname):
+    return force_redownload or refresh_downloads or not os.path.exists(fname)
+
+# downloads are saved as the raw bytes the server sent, read the text ones
+# (congress and monmouth csvs) as utf-8, replacing any stray bytes
+download_encoding = "utf-8"
+download_errors = "replace"
+
+# downloader job saving url to fname, conditional on the validators from
+# the last download of it unless re-downloading everything (the new
+# validators are remembered either way)
+def download_job(url, handler, fname):
+    return (url, handler, fname, not force_redownload)
+
+
+# handlers for downloader.download_all, run on each finished response
+
+# stream the response body to fname, resuming interrupted downloads and
+# checking download_sha256 if it lists the file
+def save_stream(fname):
+    sha256 = download_sha256.get(os.path.basename(fname))
+    return downloader.StreamToFile(fname, sha256, resume=True)
+
+# save a json list of lists response as csv
+def save_json_csv(fname):
+    def save(response):
+        rows = response.json()
+        with open(f"{fname}.part", 'w') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            for row in rows:
+                csvwriter.writerow(row)
+        os.replace(f"{fname}.part", fname)
+    return save
+
+# append a json response to the json lines file fname as a
+# {"state": state, "data": ...} record, so only one is in memory at a time
+def save_jsonl_record(fname, state):
+    def save(response):
+        jsonio.append_jsonl(fname, {"state": state, "data": jsonio.loads(response.content)})
+        return state
+    return save
+
+
 # census data by congressional district
 def download_census_district():
+    if census_batched:
+        download_census_district_batched()
+        return
+    jobs = []
     for year in census_years:
         for group in census_groups:
             fname = f"{data_dir}{census_fileA}{year}{group}{census_fileB}"
@@ -197,15 +603,53 @@ def download_census_district():
             # 2015 does not have congressional data
             if year == 2015:
                 continue
-            if force_redownload or not os.path.exists(fname):
-                response = requests.get(url)
-                with open(fname, 'w') as csvfile:
-                    csvwriter = csv.writer(csvfile)
-                    try:
-                        for row in response.json():
-                            csvwriter.writerow(row)
-                    except:
-                        print("ERROR downloading: %s" % url)
+            if want_download(fname):
+                jobs.append(download_job(url, save_json_csv(fname), fname))
+    downloader.download_all(jobs)
+
+
+
+# census_fields_by_year variables only, one merged file per year
+def download_census_district_batched():
+    jobs = []
+    for year in parse_census_years:
+        fname = f"{data_dir}{census_fileA}{year}{census_fileB}"
+        if not want_download(fname):
+            continue
+        fields = list(census_fields_by_year[str(year)].keys())
+        for i in range(0, len(fields), census_max_vars):
+            url = f"{census_urlA}{year}{census_urlD}{','.join(fields[i:i+census_max_vars])}{census_urlE}"
+            jobs.append((fname, url))
+    results = downloader.download_all([(url, lambda response: response.json())
+                                       for (fname, url) in jobs])
+
+    # join the requests of a year on their trailing state,district columns
+    tables = {}
+    for (fname, url), rows in zip(jobs, results):
+        if rows is None or tables.get(fname, []) is None:
+            tables[fname] = None
+        elif fname not in tables:
+            tables[fname] = rows
+        else:
+            extra = {tuple(r[-2:]): r[1:-2] for r in rows}
+            keys = {tuple(r[-2:]) for r in tables[fname]}
+            if keys != set(extra):
+                # every request should return every district
+                diff = sorted(keys.symmetric_difference(extra))
+                print(f"ERROR: census requests for {fname} differ in (state, district) {diff}")
+                tables[fname] = None
+                continue
+            tables[fname] = [r[:-2] + extra[tuple(r[-2:])] + r[-2:]
+                             for r in tables[fname]]
+    for fname, rows in tables.items():
+        if rows is None:
+            print(f"ERROR: census requests failed or differ, not writing {fname}")
+            continue
+        with open(f"{fname}.part", 'w') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            for row in rows:
+                csvwriter.writerow(row)
+        os.replace(f"{fname}.part", fname)
 
 
 
@@ -213,20 +657,16 @@ def download_census_district():
 def download_house_results():
     fname = f"{data_dir}{congress_file}"
     url = f"{congress_url}"
-    if force_redownload or not os.path.exists(fname):
-        response = requests.get(url)
-        with open(fname, 'w') as outfile:
-            outfile.write(response.text)
+    if want_download(fname):
+        downloader.download_all([download_job(url, save_stream(fname), fname)])
 
 
 # presidential results
 def download_pres_results():
     fname = f"{data_dir}{presidential_2016_file}"
     url = f"{presidential_2016_url}"
-    if force_redownload or not os.path.exists(fname):
-        response = requests.get(url)
-        with open(fname, 'w') as outfile:
-            outfile.write(response.text)
+    if want_download(fname):
+        downloader.download_all([download_job(url, save_stream(fname), fname)])
 
     # Not doing some downloads automatically
     fname = f"{data_dir}{presidential_2012_file}"
@@ -242,34 +682,35 @@ def download_pres_results():
 def download_pres_county_results():
     fname = f"{data_dir}{presidential_county_file}"
     url = f"{presidential_county_url}"
-    if force_redownload or not os.path.exists(fname):
-        response = requests.get(url)
-        with open(fname, 'w') as outfile:
-            outfile.write(response.text)
+    if want_download(fname):
+        downloader.download_all([download_job(url, save_stream(fname), fname)])
 
 
 # exit polls
 def download_exit_polls():
+    jobs = []
     for (k,v) in exitpolls.items():
         fname = f"{data_dir}{exitpolls_fileA}{k}{exitpolls_fileB}"
         url = f"{v}"
-        if force_redownload or not os.path.exists(fname):
-            response = requests.get(url)
-            with open(fname, 'w') as outfile:
-                outfile.write(response.text)
+        if want_download(fname):
+            jobs.append(download_job(url, save_stream(fname), fname))
+    downloader.download_all(jobs)
 
 
 # pre-election 2020 polls for predictions
 def download_2020_pres_polls():
     # Not doing some downloads automatically
     fname = f"{data_dir}{poll_2020_pres_file}"
-    if force_redownload or not os.path.exists(fname):
-        response = requests.get(f"{poll_2020_pres_url}{poll_2020_pres_xls}")
-        # Write the XLSX file to the data directory
-        newFile = open(f"{data_dir}{poll_2020_pres_file}", "wb")
-        newFile.write(response.content)
+    fxls = f"{data_dir}{poll_2020_pres_xls}"
+    if want_download(fname):
+        # Write the XLSX file to the data directory (revalidated against
+        # the csv made from it, which is left alone if it has not changed)
+        url = f"{poll_2020_pres_url}{poll_2020_pres_xls}"
+        result = downloader.download_all([download_job(url, save_stream(fxls), fname)])[0]
+        if result is None or result is downloader.NOT_MODIFIED:
+            return
         # Read it with Pandas and then write the CSV file.
-        xls = pd.ExcelFile(f"{data_dir}{poll_2020_pres_file}")
+        xls = pd.ExcelFile(fxls)
         df = pd.read_excel(xls, "National Presidential")
         df.to_csv(fname, sep=",", encoding='utf-8', index=False)
 
@@ -285,9 +726,7 @@ def download_2020_house_polls():
         print(f"  Above csv is now available at {url}")
         print(f"  so downloading from there")
 
-        response = requests.get(url)
-        with open(fname, 'w') as outfile:
-            outfile.write(response.text)
+        downloader.download_all([(url, save_stream(fname))])
 
     elif force_redownload:
         print(f"WARNING: skipping re-download of {fname}")
@@ -299,47 +738,52 @@ def download_2020_house_results():
     url = f"{results_2020hr_url}"
     fnameB = f"{data_dir}{results_2020hm_file}"
     urlB = f"{results_2020hm_url}"
-    if force_redownload or not os.path.exists(fname) or \
-       not os.path.exists(fnameB):
-        response = requests.get(url)
-        with open(fname, 'w') as outfile:
-            outfile.write(response.text)
-        response = requests.get(urlB)
-        with open(fnameB, 'w') as outfile:
-            outfile.write(response.text)
+    if want_download(fname) or want_download(fnameB):
+        downloader.download_all([download_job(url, save_stream(fname), fname),
+                                 download_job(urlB, save_stream(fnameB), fnameB)])
 
 def download_2020_pres_results():
     fname = f"{data_dir}{results_2020pr_file}"
     fnameB = f"{data_dir}{results_2020pm_file}"
-    if force_redownload or not os.path.exists(fname) or \
-       not os.path.exists(fnameB):
-        # loop across all states, put into single file wrapped json
-        stateres = []
-        statemeta = []
+    if want_download(fname) or want_download(fnameB):
+        # loop across all states, one json line per state appended to the
+        # .part files as it arrives, in whatever order the states finish
+        # (politico is rate limited per host in downloader.host_delay).
+        # Each state is revalidated against the file from the last run.
+        parts = [f"{fname}.part", f"{fnameB}.part"]
+        for f in parts:
+            if os.path.exists(f):
+                os.remove(f)
+        jobs = []
         for s in fips_state_data:
             fips = s[2]
-            abrv = s[1]
             url = f"{results_2020pr_urlA}{fips}{results_2020pr_urlB}"
             urlB = f"{results_2020pm_urlA}{fips}{results_2020pm_urlB}"
-            response = requests.get(url)
-            stateres.append(f'"{abrv}":' + response.text)
-            response = requests.get(urlB)
-            statemeta.append(f'"{abrv}":' + response.text)
-            time.sleep(1)
-        with open(fname, 'w') as outfile:
-            outfile.write("{")
-            for i,s in enumerate(stateres):
-                if i > 0:
-                    outfile.write(",")
-                outfile.write(s)
-            outfile.write("}")
-        with open(fnameB, 'w') as outfile:
-            outfile.write("{")
-            for i,s in enumerate(statemeta):
-                if i > 0:
-                    outfile.write(",")
-                outfile.write(s)
-            outfile.write("}")
+            jobs.append(download_job(url, save_jsonl_record(parts[0], s[1]), fname))
+            jobs.append(download_job(urlB, save_jsonl_record(parts[1], s[1]), fnameB))
+        results = downloader.download_all(jobs)
+        if None in results:
+            print(f"ERROR: not all states downloaded, not writing {fname}")
+            for f in parts:
+                if os.path.exists(f):
+                    os.remove(f)
+            # the states that did download are dropped with the .part files
+            downloader.forget_validators([job[0] for (job, r) in zip(jobs, results)
+                                          if r is not None and r is not downloader.NOT_MODIFIED])
+            return
+
+        for (f, part, rs) in [(fname, parts[0], results[0::2]), (fnameB, parts[1], results[1::2])]:
+            unchanged = {s[1] for (s, r) in zip(fips_state_data, rs) if r is downloader.NOT_MODIFIED}
+            if len(unchanged) == len(rs):
+                if os.path.exists(part):
+                    os.remove(part)
+                continue
+            # carry the unchanged states over from the last download
+            if unchanged:
+                for record in jsonio.iter_jsonl(f):
+                    if record['state'] in unchanged:
+                        jsonio.append_jsonl(part, record)
+            os.replace(part, f)
 
 
 
@@ -351,389 +795,154 @@ def download_2020_pres_results():
 #   eg  Gender,Male,1,2,3
 # do not care about non-democrat/republican answers
 def parse_exit_polls():
-    for (k,v) in exitpolls.items():
-        fname = f"{data_dir}{exitpolls_fileA}{k}{exitpolls_fileB}"
-        fout = f"{data_dir}{parsed_fileprefix}{exitpolls_fileA}{k}{exitpolls_parsed_fileB}"
-        result = []
-        with open(fname, "r") as infile:
-            data = json.load(infile)
-            if 'polls' in data:
-                for p in data['polls']:
-                    qname = p['question']
-                    (cD, cR, cO) = (-1, -1, 0)
-                    for c in p['candidates']:
-                        if c['fname'] == 'Democrat' or c['party'] == 'D':
-                            cD = c['id']
-                        if c['fname'] == 'Republican' or c['party'] == 'R':
-                            cR = c['id']
-                    for a in p['answers']:
-                        aname = a['answer']
-                        ares = [0, 0, 0]
-                        for ca in a['candidateanswers']:
-                            if not re.match('^[0-9]', ca['pct']):
-                                continue
-                            if ca['id'] == cD:
-                                ares[0] += int(ca['pct'])
-                            elif ca['id'] == cR:
-                                ares[1] += int(ca['pct'])
-                            else:
-                                ares[2] += int(ca['pct'])
-                        result.append([qname, aname, ares[0], ares[1], ares[2]])
-                    #print(qname)
-                    #print(result)
-
-                #print(data['polls'])
-            ## 2020 has a different format
-            ##  'questions' instead of 'polls', and other changes
-            elif 'questions' in data:
-                (cD, cR, cO) = (-1, -1, 0)
-                for c in data['candidates']:
-                    if c['partyName'] == 'Democratic':
-                        cD = c['candidateId']
-                    if c['partyName'] == 'Republican':
-                        cR = c['candidateId']
-                for p in data['questions']:
-                    qname = p['question']
-                    for a in p['answers']:
-                        aname = a['answer']
-                        ares = [0, 0, 0]
-                        for ca in a['candidateAnswers']:
-                            if type(ca['percentage']) != int and \
-                               not re.match('^[0-9]', ca['percentage']):
-                                continue
-                            if ca['candidateId'] == cD:
-                                ares[0] += int(ca['percentage'])
-                            elif ca['candidateId'] == cR:
-                                ares[1] += int(ca['percentage'])
-                            else:
-                                ares[2] += int(ca['percentage'])
-                        result.append([qname, aname, ares[0], ares[1], ares[2]])
-                    #print(qname)
-                    #print(result)
-
-                #print(data['polls'])
+    map_years(parse_exit_poll, list(exitpolls.keys()))
+
+
+# parse one exitpolls key, eg '2018h'
+def parse_exit_poll(k):
+    fname = f"{data_dir}{exitpolls_fileA}{k}{exitpolls_fileB}"
+    fout = f"{data_dir}{parsed_fileprefix}{exitpolls_fileA}{k}{exitpolls_parsed_fileB}"
+    result = []
+    found = False
+    ## 2020 has a different format
+    ##  'questions' instead of 'polls', and other changes
+    ## the questions need the candidates, so any coming before them wait
+    (cD, cR, cO) = (-1, -1, 0)
+    candidates_seen = False
+    waiting = []
+    with open(fname, "rb") as infile:
+        for (prefix, p) in jsonio.iter_items(infile, ['polls.item', 'candidates.item',
+                                                      'questions.item']):
+            if prefix == 'polls.item':
+                found = True
+                result.extend(exit_poll_rows(p))
+            elif prefix == 'candidates.item':
+                candidates_seen = True
+                if p['partyName'] == 'Democratic':
+                    cD = p['candidateId']
+                if p['partyName'] == 'Republican':
+                    cR = p['candidateId']
+            elif candidates_seen:
+                found = True
+                result.extend(exit_question_rows(p, cD, cR))
             else:
-                print("ERROR: NO polls found in %s" % fname)
+                found = True
+                waiting.append(p)
+    for p in waiting:
+        result.extend(exit_question_rows(p, cD, cR))
+    if not found:
+        print("ERROR: NO polls found in %s" % fname)
 
-        with open(fout, 'w') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            for r in result:
-                csvwriter.writerow(r)
-
-
-def state_to_abrv(name):
-    ##https://gist.github.com/rogerallen/1583593
-    us_state_abbrev = {
-        'Alabama': 'AL',
-        'Alaska': 'AK',
-        'American Samoa': 'AS',
-        'Arizona': 'AZ',
-        'Arkansas': 'AR',
-        'California': 'CA',
-        'Colorado': 'CO',
-        'Connecticut': 'CT',
-        'Delaware': 'DE',
-        'District of Columbia': 'DC',
-        'Florida': 'FL',
-        'Georgia': 'GA',
-        'Guam': 'GU',
-        'Hawaii': 'HI',
-        'Idaho': 'ID',
-        'Illinois': 'IL',
-        'Indiana': 'IN',
-        'Iowa': 'IA',
-        'Kansas': 'KS',
-        'Kentucky': 'KY',
-        'Louisiana': 'LA',
-        'Maine': 'ME',
-        'Maryland': 'MD',
-        'Massachusetts': 'MA',
-        'Michigan': 'MI',
-        'Minnesota': 'MN',
-        'Mississippi': 'MS',
-        'Missouri': 'MO',
-        'Montana': 'MT',
-        'Nebraska': 'NE',
-        'Nevada': 'NV',
-        'New Hampshire': 'NH',
-        'New Jersey': 'NJ',
-        'New Mexico': 'NM',
-        'New York': 'NY',
-        'North Carolina': 'NC',
-        'North Dakota': 'ND',
-        'Northern Mariana Islands':'MP',
-        'Ohio': 'OH',
-        'Oklahoma': 'OK',
-        'Oregon': 'OR',
-        'Pennsylvania': 'PA',
-        'Puerto Rico': 'PR',
-        'Rhode Island': 'RI',
-        'South Carolina': 'SC',
-        'South Dakota': 'SD',
-        'Tennessee': 'TN',
-        'Texas': 'TX',
-        'Utah': 'UT',
-        'Vermont': 'VT',
-        'Virgin Islands': 'VI',
-        'Virginia': 'VA',
-        'Washington': 'WA',
-        'West Virginia': 'WV',
-        'Wisconsin': 'WI',
-        'Wyoming': 'WY'
-    }
-    return us_state_abbrev[name]
-
-
-def normalize_census_district(name):
-    dist, state = (1, "")
-    s = re.search(", (.*)$", name)
-    if s:
-        state = s.group(1)
-    else:
-        print("ERROR: unable to parse district " % name)
-    d = re.search("^Congressional District (\d+) ", name)
-    if d:
-        dist = d.group(1)
-    return (state_to_abrv(state),dist)
+    write_table(fout, result)
+
+
+# rows of one question of the 'polls' format
+def exit_poll_rows(p):
+    result = []
+    qname = p['question']
+    (cD, cR, cO) = (-1, -1, 0)
+    for c in p['candidates']:
+        if c['fname'] == 'Democrat' or c['party'] == 'D':
+            cD = c['id']
+        if c['fname'] == 'Republican' or c['party'] == 'R':
+            cR = c['id']
+    for a in p['answers']:
+        aname = a['answer']
+        ares = [0, 0, 0]
+        for ca in a['candidateanswers']:
+            if not re.match('^[0-9]', ca['pct']):
+                continue
+            if ca['id'] == cD:
+                ares[0] += int(ca['pct'])
+            elif ca['id'] == cR:
+                ares[1] += int(ca['pct'])
+            else:
+                ares[2] += int(ca['pct'])
+        result.append([qname, aname, ares[0], ares[1], ares[2]])
+    return result
+
+
+# rows of one question of the 2020 'questions' format
+def exit_question_rows(p, cD, cR):
+    result = []
+    qname = p['question']
+    for a in p['answers']:
+        aname = a['answer']
+        ares = [0, 0, 0]
+        for ca in a['candidateAnswers']:
+            if type(ca['percentage']) != int and \
+               not re.match('^[0-9]', ca['percentage']):
+                continue
+            if ca['candidateId'] == cD:
+                ares[0] += int(ca['percentage'])
+            elif ca['candidateId'] == cR:
+                ares[1] += int(ca['percentage'])
+            else:
+                ares[2] += int(ca['percentage'])
+        result.append([qname, aname, ares[0], ares[1], ares[2]])
+    return result
+
+
+# district name parsing lives in districts.py
+state_to_abrv = districts.state_to_abrv
+normalize_census_district = districts.parse_census_name
+
+
+# raw census files parse_census_districts reads for a year
+def census_parse_files(year):
+    if census_batched:
+        return [f"{census_fileA}{year}{census_fileB}"]
+    # any group mentioned in census_fields_by_year
+    return [f"{census_fileA}{year}{group}{census_fileB}"
+            for group in ['DP02', 'DP03', 'DP05']]
 
 
 def parse_census_districts():
     # create datasets
-    # per district
-    parse_census_years = [2012,2014,2016,2018,2019]
-
-    # the fields below are from these labels - for easier searching
-    # CITIZEN, VOTING AGE POPULATION  or  SEX AND AGE + U.S. CITIZENSHIP STATUS
-    # RACE
-    # EDUCATIONAL ATTAINMENT
-    # SEX AND AGE
-    # INCOME AND BENEFITS
-    census_fields_by_year = {
-        # https://api.census.gov/data/2019/acs/acs1/profile/variables.html
-        '2019': {'DP05_0087E': 'voteage_pop',
-                 'DP05_0088E': 'voteage_m',
-                 'DP05_0089E': 'voteage_f',
-                 'DP05_0033E': 'race_pop',
-                 'DP05_0037E': 'race_white',
-                 'DP05_0065E': 'race_black',
-                 'DP05_0067E': 'race_asian',
-                 'DP05_0071E': 'race_hisp',
-                 'DP02_0059E': 'ed_pop',
-                 'DP02_0065E': 'ed_ba',
-                 'DP02_0066E': 'ed_grdeg',
-                 'DP05_0001E': 'age_pop',
-                 'DP05_0009E': 'age_20_24',
-                 'DP05_0010E': 'age_25_34',
-                 'DP05_0011E': 'age_35_44',
-                 'DP05_0012E': 'age_45_54',
-                 'DP05_0013E': 'age_55_59',
-                 'DP05_0014E': 'age_60_64',
-                 'DP05_0021E': 'age_18_plus',
-                 'DP05_0022E': 'age_21_plus',
-                 'DP05_0024E': 'age_65_plus',
-                 'DP03_0051E': 'inc_pop',
-                 'DP03_0052E': 'inc_less_10',
-                 'DP03_0053E': 'inc_10_14',
-                 'DP03_0054E': 'inc_15_24',
-                 'DP03_0055E': 'inc_25_34',
-                 'DP03_0056E': 'inc_35_49',
-                 'DP03_0057E': 'inc_50_74',
-                 'DP03_0058E': 'inc_75_99',
-                 'DP03_0059E': 'inc_100_149',
-                 'DP03_0060E': 'inc_150_199',
-                 'DP03_0061E': 'inc_200_plus',
-        },
-        # https://api.census.gov/data/2018/acs/acs1/profile/variables.html
-        '2018': {'DP05_0087E': 'voteage_pop',
-                 'DP05_0088E': 'voteage_m',
-                 'DP05_0089E': 'voteage_f',
-                 'DP05_0033E': 'race_pop',
-                 'DP05_0037E': 'race_white',
-                 'DP05_0065E': 'race_black',
-                 'DP05_0067E': 'race_asian',
-                 'DP05_0071E': 'race_hisp',
-                 'DP02_0058E': 'ed_pop',
-                 'DP02_0064E': 'ed_ba',
-                 'DP02_0065E': 'ed_grdeg',
-                 'DP05_0001E': 'age_pop',
-                 'DP05_0009E': 'age_20_24',
-                 'DP05_0010E': 'age_25_34',
-                 'DP05_0011E': 'age_35_44',
-                 'DP05_0012E': 'age_45_54',
-                 'DP05_0013E': 'age_55_59',
-                 'DP05_0014E': 'age_60_64',
-                 'DP05_0021E': 'age_18_plus',
-                 'DP05_0022E': 'age_21_plus',
-                 'DP05_0024E': 'age_65_plus',
-                 'DP03_0051E': 'inc_pop',
-                 'DP03_0052E': 'inc_less_10',
-                 'DP03_0053E': 'inc_10_14',
-                 'DP03_0054E': 'inc_15_24',
-                 'DP03_0055E': 'inc_25_34',
-                 'DP03_0056E': 'inc_35_49',
-                 'DP03_0057E': 'inc_50_74',
-                 'DP03_0058E': 'inc_75_99',
-                 'DP03_0059E': 'inc_100_149',
-                 'DP03_0060E': 'inc_150_199',
-                 'DP03_0061E': 'inc_200_plus',
-        },
-        # https://api.census.gov/data/2016/acs/acs1/profile/variables.html
-        '2016': {'DP05_0082E': 'voteage_pop',
-                 'DP05_0083E': 'voteage_m',
-                 'DP05_0084E': 'voteage_f',
-                 'DP05_0028E': 'race_pop',
-                 'DP05_0032E': 'race_white',
-                 'DP05_0060E': 'race_black',
-                 'DP05_0062E': 'race_asian',
-                 'DP05_0066E': 'race_hisp',
-                 'DP02_0058E': 'ed_pop',
-                 'DP02_0064E': 'ed_ba',
-                 'DP02_0065E': 'ed_grdeg',
-                 'DP05_0001E': 'age_pop',
-                 'DP05_0008E': 'age_20_24',
-                 'DP05_0009E': 'age_25_34',
-                 'DP05_0010E': 'age_35_44',
-                 'DP05_0011E': 'age_45_54',
-                 'DP05_0012E': 'age_55_59',
-                 'DP05_0013E': 'age_60_64',
-                 'DP05_0018E': 'age_18_plus',
-                 'DP05_0019E': 'age_21_plus',
-                 'DP05_0021E': 'age_65_plus',
-                 'DP03_0051E': 'inc_pop',
-                 'DP03_0052E': 'inc_less_10',
-                 'DP03_0053E': 'inc_10_14',
-                 'DP03_0054E': 'inc_15_24',
-                 'DP03_0055E': 'inc_25_34',
-                 'DP03_0056E': 'inc_35_49',
-                 'DP03_0057E': 'inc_50_74',
-                 'DP03_0058E': 'inc_75_99',
-                 'DP03_0059E': 'inc_100_149',
-                 'DP03_0060E': 'inc_150_199',
-                 'DP03_0061E': 'inc_200_plus',
-        },
-        # https://api.census.gov/data/2014/acs/acs1/profile/variables.html
-        '2014': {#'DP05_0082E': 'voteage_pop',
-                 #'DP05_0083E': 'voteage_m',
-                 #'DP05_0084E': 'voteage_f',
-                 'DP05_0001E': 'allage_pop',
-                 'DP05_0002E': 'allage_m',
-                 'DP05_0003E': 'allage_f',
-                 'DP05_0018E': 'allage_18plus',
-                 'DP02_0095PE': 'allage_citzenpct',
-                 'DP05_0028E': 'race_pop',
-                 'DP05_0032E': 'race_white',
-                 'DP05_0060E': 'race_black',
-                 'DP05_0062E': 'race_asian',
-                 'DP05_0066E': 'race_hisp',
-                 'DP02_0058E': 'ed_pop',
-                 'DP02_0064E': 'ed_ba',
-                 'DP02_0065E': 'ed_grdeg',
-                 'DP05_0001E': 'age_pop',
-                 'DP05_0008E': 'age_20_24',
-                 'DP05_0009E': 'age_25_34',
-                 'DP05_0010E': 'age_35_44',
-                 'DP05_0011E': 'age_45_54',
-                 'DP05_0012E': 'age_55_59',
-                 'DP05_0013E': 'age_60_64',
-                 'DP05_0018E': 'age_18_plus',
-                 'DP05_0019E': 'age_21_plus',
-                 'DP05_0021E': 'age_65_plus',
-                 'DP03_0051E': 'inc_pop',
-                 'DP03_0052E': 'inc_less_10',
-                 'DP03_0053E': 'inc_10_14',
-                 'DP03_0054E': 'inc_15_24',
-                 'DP03_0055E': 'inc_25_34',
-                 'DP03_0056E': 'inc_35_49',
-                 'DP03_0057E': 'inc_50_74',
-                 'DP03_0058E': 'inc_75_99',
-                 'DP03_0059E': 'inc_100_149',
-                 'DP03_0060E': 'inc_150_199',
-                 'DP03_0061E': 'inc_200_plus',
-        },
-        # https://api.census.gov/data/2012/acs/acs1/profile/variables.html
-        '2012': {#'DP05_0082E': 'voteage_pop',
-                 #'DP05_0083E': 'voteage_m',
-                 #'DP05_0084E': 'voteage_f',
-                 'DP05_0001E': 'allage_pop',
-                 'DP05_0002E': 'allage_m',
-                 'DP05_0003E': 'allage_f',
-                 'DP05_0018E': 'allage_18plus',
-                 'DP02_0095PE': 'allage_citzenpct',
-                 'DP05_0028E': 'race_pop',
-                 'DP05_0032E': 'race_white',
-                 'DP05_0060E': 'race_black',
-                 'DP05_0062E': 'race_asian',
-                 'DP05_0066E': 'race_hisp',
-                 'DP02_0058E': 'ed_pop',
-                 'DP02_0064E': 'ed_ba',
-                 'DP02_0065E': 'ed_grdeg',
-                 'DP05_0001E': 'age_pop',
-                 'DP05_0008E': 'age_20_24',
-                 'DP05_0009E': 'age_25_34',
-                 'DP05_0010E': 'age_35_44',
-                 'DP05_0011E': 'age_45_54',
-                 'DP05_0012E': 'age_55_59',
-                 'DP05_0013E': 'age_60_64',
-                 'DP05_0018E': 'age_18_plus',
-                 'DP05_0019E': 'age_21_plus',
-                 'DP05_0021E': 'age_65_plus',
-                 'DP03_0051E': 'inc_pop',
-                 'DP03_0052E': 'inc_less_10',
-                 'DP03_0053E': 'inc_10_14',
-                 'DP03_0054E': 'inc_15_24',
-                 'DP03_0055E': 'inc_25_34',
-                 'DP03_0056E': 'inc_35_49',
-                 'DP03_0057E': 'inc_50_74',
-                 'DP03_0058E': 'inc_75_99',
-                 'DP03_0059E': 'inc_100_149',
-                 'DP03_0060E': 'inc_150_199',
-                 'DP03_0061E': 'inc_200_plus',
-        },
-    }
-
-    census_groups = {'DP05', 'DP02', 'DP03'} # any group mentioned above
+    # per district (for parse_census_years)
+    map_years(parse_census_year, parse_census_years)
 
-    for year in parse_census_years:
-        result = {}
-        census_fields = census_fields_by_year[str(year)]
-        for group in census_groups:
-            fname = f"{data_dir}{census_fileA}{year}{group}{census_fileB}"
-            field_map = {}
-            with open(fname, 'r') as csvfile:
-                csvreader = csv.reader(csvfile)
-                for row in csvreader:
-                    # header
-                    if row[0] == "NAME":
-                        for i in range(0, len(row)):
-                            if row[i] in census_fields:
-                                field_map[census_fields[row[i]]] = i
-                                #print("Found %s" % row[i])
-                        continue
-                    st,d = normalize_census_district(row[0])
-                    dname = f"{st}-{d}"
-                    if dname not in result:
-                        result[dname] = {'state': st, 'district': d}
-                    for k,v in field_map.items():
-                        result[dname][k] = row[v]
-
-
-        fout = f"{data_dir}{parsed_fileprefix}{census_fileA}{year}{census_fileB}"
-        with open(fout, 'w') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            header = ['year', 'state','district']
-            for k,v in census_fields.items():
-                header.append(v)
-            csvwriter.writerow(header)
-            for d in sorted(result.keys()):
-                r = [year, result[d]['state'], result[d]['district']]
-                for k,v in census_fields.items():
-                    if v in result[d]:
-                        r.append(result[d][v])
-                    else:
-                        r.append(0)
-                        print("Missing %s for %s,%s" % (v, d, year))
 
-                csvwriter.writerow(r)
+def parse_census_year(year):
+    result = {}
+    census_fields = census_fields_by_year[str(year)]
+    for fname in census_parse_files(year):
+        fname = f"{data_dir}{fname}"
+        # only materialize NAME and the wanted fields, the tables are
+        # hundreds of columns wide (kept as text, as written)
+        df = pd.read_csv(fname, dtype=str, keep_default_na=False,
+                         usecols=lambda c: c == "NAME" or c in census_fields)
+        fields = [c for c in df.columns if c != "NAME"]
+        field_names = [census_fields[c] for c in fields]
+        # "ST-D" keys of all the names at once
+        keys = districts.census_name_keys(df["NAME"])
+        for name in df["NAME"][keys.isna()]:
+            print("ERROR: unable to parse district %s" % name)
+        for dname, values in zip(keys, df[fields].itertuples(index=False, name=None)):
+            if not isinstance(dname, str):
+                continue
+            if dname not in result:
+                st,d = dname.split("-")
+                result[dname] = {'state': st, 'district': d}
+            result[dname].update(zip(field_names, values))
+
+
+    fout = f"{data_dir}{parsed_fileprefix}{census_fileA}{year}{census_fileB}"
+    header = ['year', 'state','district']
+    for k,v in census_fields.items():
+        header.append(v)
+    rows = []
+    for d in sorted(result.keys()):
+        r = [year, result[d]['state'], result[d]['district']]
+        for k,v in census_fields.items():
+            if v in result[d]:
+                r.append(result[d][v])
+            else:
+                r.append(0)
+                print("Missing %s for %s,%s" % (v, d, year))
+
+        rows.append(r)
+    write_table(fout, rows, header)
 
 
 
@@ -742,7 +951,7 @@ def parse_2020_house_polls():
     fout = f"{data_dir}{parsed_fileprefix}{poll_2020_house_file}"
     result = {}
     # really not a traditional csv (converted pdf page with multiple tables)
-    with open(fname, 'r') as csvfile:
+    with open(fname, 'r', encoding=download_encoding, errors=download_errors) as csvfile:
         csvreader = csv.reader(csvfile)
         # multiple sub-headers, find the appropriate one
         next_gender = False
@@ -816,12 +1025,12 @@ def parse_2020_house_polls():
                 result['Education,College Graduate'][fld] = row[3]
 
     # save results
-    with open(fout, 'w') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        for k,v in result.items():
-            newarr = k.split(",")
-            newarr.extend(v)
-            csvwriter.writerow(newarr)
+    rows = []
+    for k,v in result.items():
+        newarr = k.split(",")
+        newarr.extend(v)
+        rows.append(newarr)
+    write_table(fout, rows)
 
 
 
@@ -831,50 +1040,56 @@ def parse_2020_house_results():
     fout = f"{data_dir}{parsed_fileprefix}{results_2020hr_file}{res2020_parsed_fileB}"
 
     result = []
-    (data, dataB) = ([],[])
-    with open(fname, "r") as infile:
-        data = json.load(infile)
-    with open(fnameB, "r") as infile:
-        dataB = json.load(infile)
-    # create lookup of metadata
+    (mlookup, clookup) = house_2020_meta(fnameB)
+    # races one at a time, the live results file is large
+    with open(fname, "rb") as infile:
+        for (prefix, r) in jsonio.iter_items(infile, ['races.item']):
+            result.append(house_2020_row(r, mlookup, clookup))
+
+    write_table(fout, result)
+
+
+# lookups of the politico metadata by raceid and by candidateID
+def house_2020_meta(fname):
     mlookup = {}
     clookup = {}
-    for r in dataB:
-        mlookup[r['raceid']] = r
-        for c in r['candidates']:
-            clookup[c['candidateID']] = c
-    for r in data['races']:
-        #WANT: year,state,district,dem,rep,tot,incumbent,prevparty
-        rid = r['raceid']
-        s = r['stateFips']
-        sname = fips_to_state[s]
-        d = r['district']
-        dn = int(d) if d != "00" else 1
-        tmparr = [2020, sname, dn, 0, 0, 0, 0, ""]
-        if mlookup[rid]['holdingParty'] == "gop":
-            tmparr[7] = 'r'
-        elif mlookup[rid]['holdingParty'] == "dem":
-            tmparr[7] = 'd'
-        else:
-            #print("UNKNOWN PARTY: ", mlookup[rid]['holdingParty'])
-            pass
-        for c in mlookup[rid]['candidates']:
-            if c['incumbent']:
-                tmparr[6] = 1
-        for c in r['candidates']:
-            v = c['vote']
-            party = clookup[c['candidateID']]['party']
-            if party == "dem":
-                tmparr[3] += v
-            if party == "gop":
-                tmparr[4] += v
-            tmparr[5] += v
-        result.append(tmparr)
-
-    with open(fout, 'w') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        for r in result:
-            csvwriter.writerow(r)
+    with open(fname, "rb") as infile:
+        for (prefix, r) in jsonio.iter_items(infile, ['item']):
+            mlookup[r['raceid']] = r
+            for c in r['candidates']:
+                clookup[c['candidateID']] = c
+    return (mlookup, clookup)
+
+
+# parsed row of a politico race, with the race and candidate metadata
+# (also used by poll_house_results.py for each updated race)
+def house_2020_row(r, mlookup, clookup):
+    #WANT: year,state,district,dem,rep,tot,incumbent,prevparty
+    rid = r['raceid']
+    s = r['stateFips']
+    sname = fips_to_state[s]
+    d = r['district']
+    dn = int(d) if d != "00" else 1
+    tmparr = [2020, sname, dn, 0, 0, 0, 0, ""]
+    if mlookup[rid]['holdingParty'] == "gop":
+        tmparr[7] = 'r'
+    elif mlookup[rid]['holdingParty'] == "dem":
+        tmparr[7] = 'd'
+    else:
+        #print("UNKNOWN PARTY: ", mlookup[rid]['holdingParty'])
+        pass
+    for c in mlookup[rid]['candidates']:
+        if c['incumbent']:
+            tmparr[6] = 1
+    for c in r['candidates']:
+        v = c['vote']
+        party = clookup[c['candidateID']]['party']
+        if party == "dem":
+            tmparr[3] += v
+        if party == "gop":
+            tmparr[4] += v
+        tmparr[5] += v
+    return tmparr
 
 
 
@@ -935,208 +1150,359 @@ def read_parsed_demo_file(fname, use_alt_cols = False):
             "Are you a college graduate?,No" : "Education,HS or less",
             "Are You a College Graduate?,No" : "Education,HS or less",
         }
-        with open(fname) as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                # data cleanup
-                row[0] = row[0].replace('Vote by ', '')
-                if row[1] in democolsrepl: row[1] = democolsrepl[row[1]]
+        for row in read_table(fname, has_header=False)[1]:
+            # data cleanup
+            row[0] = str(row[0]).replace('Vote by ', '')
+            if row[1] in democolsrepl: row[1] = democolsrepl[row[1]]
+            k = f"{row[0]},{row[1]}"
+            if k in demofcolrepl:
+                (row[0], row[1]) = demofcolrepl[k].split(",")
                 k = f"{row[0]},{row[1]}"
-                if k in demofcolrepl:
-                    (row[0], row[1]) = demofcolrepl[k].split(",")
-                    k = f"{row[0]},{row[1]}"
-                #print("KEY is =%s=" % k)
-                if k in democols:
-                    demrepdiff = int(row[2]) - int(row[3])
-                    demod[k.replace(",", "_")] = demrepdiff
-                    #print("FOUND DEM %s = %s" % (k, demrepdiff) )
+            #print("KEY is =%s=" % k)
+            if k in democols:
+                demrepdiff = int(row[2]) - int(row[3])
+                demod[k.replace(",", "_")] = demrepdiff
+                #print("FOUND DEM %s = %s" % (k, demrepdiff) )
 
         return (demod, democols)
 
 
 
+# read the congress results a single time and index the general election
+# rows by year then district, with the per-candidate fields as columns
+#   {2018: {"MA-1": {'state': 'MA', 'district': '1', 'totalvotes': '...',
+#                    'candidate': [...], 'party': [...], 'candidatevotes': [...]}}}
+# The index is pickled next to the csv and reused until the csv changes.
+def load_house_index():
+    fname = f"{data_dir}{congress_file}"
+    fidx = f"{fname}{congress_index_suffix}"
+    fstat = os.stat(fname)
+    stamp = (fstat.st_size, fstat.st_mtime_ns)
+    if not force_redownload and os.path.exists(fidx):
+        with open(fidx, 'rb') as infile:
+            (idx_stamp, index) = pickle.load(infile)
+        if idx_stamp == stamp:
+            return index
+
+    index = {}
+    with open(fname, 'r', encoding=download_encoding, errors=download_errors) as csvfile:
+        csvreader = csv.reader(csvfile)
+        votingh = next(csvreader)
+        (cyear, cstage, cst, cd, cp, ccand, cvote, ctot) = \
+            [votingh.index(x) for x in ['year', 'stage', 'state_po', 'district',
+                                        'party', 'candidate', 'candidatevotes',
+                                        'totalvotes']]
+        for row in csvreader:
+            # ignore primaries/runoffs
+            if row[cstage] != "gen": continue
+            st = row[cst]
+            d = row[cd]
+            if d == "0": d = "1"
+            key = f"{st}-{d}"
+            yeard = index.setdefault(int(row[cyear]), {})
+            if key not in yeard:
+                yeard[key] = {'state': st, 'district': d, 'totalvotes': row[ctot],
+                              'candidate': [], 'party': [], 'candidatevotes': []}
+            yeard[key]['candidate'].append(row[ccand])
+            yeard[key]['party'].append(row[cp])
+            yeard[key]['candidatevotes'].append(int(row[cvote]))
+
+    with open(fidx, 'wb') as outfile:
+        pickle.dump((stamp, index), outfile)
+    return index
+
+
 # now for a single record with everything for house elections
 def join_house_data():
     cong_years = [2010, 2012, 2014, 2016, 2018]
     historical_votes = {}
+    house_index = load_house_index()
     for year in cong_years:
-        # get voting results from 1976-2018-house2.csv
+        # get voting results from 1976-2018-house2.csv (via house_index)
         # get census from parsed_census-by-congress_2018.csv
         # get exit polls from parsed_exitpolls_2018h.csv
 
-        votingh = []
         votingd = {}
-        fname = f"{data_dir}{congress_file}"
-        with open(fname, 'r') as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                if row[0] == "year":
-                    votingh = row
-                    continue
-                if row[0] != str(year): continue
-                # ignore primaries/runoffs
-                if row[votingh.index('stage')] != "gen": continue
-                st = row[votingh.index('state_po')]
-                d = row[votingh.index('district')]
-                if d == "0": d = "1"
-                p = row[votingh.index('party')]
-                t = row[votingh.index('totalvotes')]
-                pvote = row[votingh.index('candidatevotes')]
-                key = f"{st}-{d}"
-                if key not in votingd:
-                    votingd[key] = [year, st, d, 0, 0, t, "", "", 0, 0]
+        for key, res in house_index.get(year, {}).items():
+            votingd[key] = [year, res['state'], res['district'], 0, 0,
+                            res['totalvotes'], "", "", 0, 0]
+            for (cand, p, pvote) in zip(res['candidate'], res['party'],
+                                        res['candidatevotes']):
                 if p == "democrat" or p == "democratic-farmer-labor":
-                    votingd[key][3] += int(pvote)
+                    votingd[key][3] += pvote
                 elif p == 'republican':
-                    votingd[key][4] += int(pvote)
+                    votingd[key][4] += pvote
                 #record person with most votes and party
-                if int(pvote) > votingd[key][8]:
-                    votingd[key][6] = row[votingh.index('candidate')]
+                if pvote > votingd[key][8]:
+                    votingd[key][6] = cand
                     votingd[key][7] = p[0] if p != "" else ""
-                    votingd[key][8] = int(pvote)
+                    votingd[key][8] = pvote
                     # current candidate matches last winner -> incumbent
                     if str(year-2) in historical_votes and \
                        key in historical_votes[str(year-2)] and \
-                       historical_votes[str(year-2)][key][6] == row[votingh.index('candidate')]:
+                       historical_votes[str(year-2)][key][6] == cand:
                         votingd[key][9] = 1
 
         # save for future lookups
         historical_votes[str(year)] = votingd
-        if year == 2010:
-            continue
-
-
-        censush = []
-        censusd = {}
-        fname = f"{data_dir}{parsed_fileprefix}{census_fileA}{year}{census_fileB}"
-        with open(fname, 'r') as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                if row[0] == "year":
-                    censush = row
-                    continue
-                censusd[f"{row[1]}-{row[2]}"] = row
-
-        (demod, democols) = read_parsed_demo_file(f"{data_dir}{parsed_fileprefix}{exitpolls_fileA}{year}h{exitpolls_parsed_fileB}")
 
-        # write final data
-        fout = f"{data_dir}{interim_fileprefix}{year}h{interim_filesuffix}"
-        with open(fout, 'w') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            censush = censush[0:3] +['dem', 'rep', 'tot', 'incumbent', 'prevparty'] + censush[3:]
-            censush.extend(democols)
-            csvwriter.writerow(censush)
-            for d in sorted(censusd.keys()):
-                row = censusd[d][0:3]
-                if d in votingd:
-                    row.extend(votingd[d][3:6])
-                    incumbent = votingd[d][9]
-                    prevp = ""
-                    if d in historical_votes[str(year-2)]:
-                        prevp = historical_votes[str(year - 2)][d][7]
-                    row.extend([incumbent,prevp])
-                else:
-                    row.extend([0,0,0,0,""])
-                    if d != "DC-1" and d != "PR-1":
-                        print("NO voting results for %s %s" % (year,d))
-                row.extend(censusd[d][3:])
-                for c in democols:
-                    k = c.replace(",", "_")
-                    if k in demod:
-                        row.append(demod[k])
-                    else:
-                        row.append("")
-                csvwriter.writerow(row)
+    # the census and poll joins of each year are independent, given the
+    # results of the year and the previous cycle
+    join_years = cong_years[1:]
+    map_years(join_house_year, join_years,
+              [historical_votes[str(year)] for year in join_years],
+              [historical_votes[str(year-2)] for year in join_years])
+    join_house_2020()
+
+
+# interim data for a past year, from its results (votingd) and the previous
+# cycle's results (prev_votingd) from join_house_data
+def join_house_year(year, votingd, prev_votingd):
+    censusd = {}
+    fname = f"{data_dir}{parsed_fileprefix}{census_fileA}{year}{census_fileB}"
+    (censush, rows) = read_table(fname)
+    for row in rows:
+        censusd[f"{row[1]}-{row[2]}"] = row
+
+    (demod, democols) = read_parsed_demo_file(f"{data_dir}{parsed_fileprefix}{exitpolls_fileA}{year}h{exitpolls_parsed_fileB}")
+
+    # write final data
+    fout = f"{data_dir}{interim_fileprefix}{year}h{interim_filesuffix}"
+    censush = censush[0:3] +['dem', 'rep', 'tot', 'incumbent', 'prevparty'] + censush[3:]
+    censush.extend(democols)
+    rows = []
+    for d in sorted(censusd.keys()):
+        row = censusd[d][0:3]
+        if d in votingd:
+            row.extend(votingd[d][3:6])
+            incumbent = votingd[d][9]
+            prevp = ""
+            if d in prev_votingd:
+                prevp = prev_votingd[d][7]
+            row.extend([incumbent,prevp])
+        else:
+            row.extend([0,0,0,0,""])
+            if d != "DC-1" and d != "PR-1":
+                print("NO voting results for %s %s" % (year,d))
+        row.extend(censusd[d][3:])
+        for c in democols:
+            k = c.replace(",", "_")
+            if k in demod:
+                row.append(demod[k])
+            else:
+                row.append("")
+        rows.append(row)
+    write_table(fout, rows, censush)
 
 
-    # and now do 2020
-    # use census data, but add custom pre-election polling and results
+# and now do 2020
+# use census data, but add custom pre-election polling and results
+def join_house_2020():
     for year in [2020]:
 
         # have to use 2019 census data since 2020 is not ready yet
-        censush = []
         censusd = {}
         fname = f"{data_dir}{parsed_fileprefix}{census_fileA}{year-1}{census_fileB}"
-        with open(fname, 'r') as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                if row[0] == "year":
-                    censush = row
-                    continue
-                censusd[f"{row[1]}-{row[2]}"] = row
+        (censush, rows) = read_table(fname)
+        for row in rows:
+            censusd[f"{row[1]}-{row[2]}"] = row
 
         # read the pre-election polls
         (demod, democols) = read_parsed_demo_file(f"{data_dir}{parsed_fileprefix}{poll_2020_house_file}", True)
 
         # read in actual results (for test accuracy only)
-        votingh = []
+        # poll_house_results.py appends updated rows, the last one wins
         votingd = {}
         fname = f"{data_dir}{parsed_fileprefix}{results_2020hr_file}{res2020_parsed_fileB}"
-        with open(fname, 'r') as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                if row[0] == "year":
-                    censush = row
-                    continue
-                votingd[f"{row[1]}-{row[2]}"] = row
-            votingh.append(row)
+        for row in read_table(fname, has_header=False)[1]:
+            votingd[f"{row[1]}-{row[2]}"] = row
 
         # write final data
         fout = f"{data_dir}{interim_fileprefix}{year}h{interim_filesuffix}"
-        with open(fout, 'w') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            censush = censush[0:3] +['dem', 'rep', 'tot', 'incumbent', 'prevparty'] + censush[3:]
-            censush.extend(democols)
-            csvwriter.writerow(censush)
-            for d in sorted(censusd.keys()):
-                row = censusd[d][0:3]
-                row[0] = year
-                if d in votingd:
-                    row.extend(votingd[d][3:8])
+        censush = censush[0:3] +['dem', 'rep', 'tot', 'incumbent', 'prevparty'] + censush[3:]
+        censush.extend(democols)
+        rows = []
+        for d in sorted(censusd.keys()):
+            row = censusd[d][0:3]
+            row[0] = year
+            if d in votingd:
+                row.extend(votingd[d][3:8])
+            else:
+                row.extend([0,0,0,0,""])
+                if d != "DC-1" and d != "PR-1":
+                    print("NO voting results for %s %s" % (year,d))
+            row.extend(censusd[d][3:])
+            for c in democols:
+                k = c.replace(",", "_")
+                if k in demod:
+                    row.append(demod[k])
                 else:
-                    row.extend([0,0,0,0,""])
-                    if d != "DC-1" and d != "PR-1":
-                        print("NO voting results for %s %s" % (year,d))
-                row.extend(censusd[d][3:])
-                for c in democols:
-                    k = c.replace(",", "_")
-                    if k in demod:
-                        row.append(demod[k])
-                    else:
-                        row.append("")
-                csvwriter.writerow(row)
+                    row.append("")
+            rows.append(row)
+        write_table(fout, rows, censush)
 
 
 
 # now for a single record with everything for pres elections
 def join_pres_data():
-    print("@@@TODO - join pres data")
-    return
-
-"""
-pres_years = [2012]
-for year in pres_years:
-    exitpollsparsed_2012p.csv
-"""
+    years = [year for year in pres_years
+             if os.path.exists(f"{data_dir}{pres_files[year]}")]
+    for year in pres_years:
+        if year not in years:
+            print(f"WARNING: no {data_dir}{pres_files[year]}, skipping {year} pres data")
+    if len(years) == 0:
+        return
+
+    crosswalk = None
+    fcross = f"{data_dir}{pres_crosswalk_file}"
+    if os.path.exists(fcross):
+        cols = [pres_columns['state'], pres_columns['county'], pres_columns['precinct']]
+        crosswalk = pd.read_csv(fcross, dtype=str, keep_default_na=False)
+        crosswalk = crosswalk.rename(columns={'state_postal': cols[0], 'county_fips': cols[1],
+                                              'precinct': cols[2], 'district': '_district'})
+        if 'weight' not in crosswalk.columns:
+            crosswalk['weight'] = "1"
+        crosswalk['weight'] = crosswalk['weight'].astype(float)
+
+    votings = map_years(aggregate_pres_precincts,
+                        [f"{data_dir}{pres_files[year]}" for year in years],
+                        [crosswalk] * len(years))
+    votings = dict(zip(years, votings))
+    map_years(join_pres_year, years,
+              [votings[year] for year in years],
+              [votings.get(year - 4, {}) for year in years])
+
+
+# dem, rep and total votes of each district ("MA-1") in a precinct file,
+# read pres_chunk_rows at a time and summed into arrays
+def aggregate_pres_precincts(fname, crosswalk=None):
+    cols = pres_columns
+    keycols = [cols['state'], cols['county'], cols['precinct']]
+    usecols = [cols['state'], cols['party'], cols['votes']]
+    usecols += keycols[1:] if crosswalk is not None else [cols['district']]
+
+    index = {}
+    totals = np.zeros((0, 3))
+    unmapped = 0.0
+    for chunk in pd.read_csv(fname, usecols=usecols, dtype=str, keep_default_na=False,
+                             encoding=pres_encoding, chunksize=pres_chunk_rows):
+        if crosswalk is not None:
+            chunk = chunk.merge(crosswalk, on=keycols, how='left')
+            district = chunk['_district']
+            weight = chunk['weight'].fillna(0).to_numpy()
+        else:
+            district = chunk[cols['district']]
+            weight = 1.0
+        votes = pd.to_numeric(chunk[cols['votes']], errors='coerce').fillna(0).to_numpy()
+
+        # at large districts are 1, like the census
+        dn = pd.to_numeric(district, errors='coerce')
+        mapped = dn.notna().to_numpy()
+        unmapped += votes[~mapped].sum()
+        votes = votes * weight
+        dn = dn[mapped].astype(int).replace(0, 1)
+        keys = (chunk[cols['state']][mapped] + "-" + dn.astype(str)).to_numpy()
+        votes = votes[mapped]
+        party = chunk[cols['party']][mapped].str.lower()
+
+        (uniq, inverse) = np.unique(keys, return_inverse=True)
+        codes = np.array([index.setdefault(k, len(index)) for k in uniq], dtype=np.int64)
+        idx = codes[inverse]
+        if len(index) > len(totals):
+            totals = np.vstack([totals, np.zeros((len(index) - len(totals), 3))])
+        n = len(totals)
+        totals[:, 0] += np.bincount(idx, votes * party.isin(pres_dem_parties).to_numpy(), minlength=n)
+        totals[:, 1] += np.bincount(idx, votes * party.isin(pres_rep_parties).to_numpy(), minlength=n)
+        totals[:, 2] += np.bincount(idx, votes, minlength=n)
+
+    if unmapped > 0:
+        print(f"WARNING: {unmapped:.0f} votes in {fname} not mapped to a district")
+    return {k: totals[i].round().astype(np.int64).tolist() for k, i in index.items()}
+
+
+# interim data for a presidential year, like join_house_year, from the
+# district votes of the year and of the previous presidential election
+#   votingd: {"MA-1": [dem, rep, tot]}
+def join_pres_year(year, votingd, prev_votingd):
+    censusd = {}
+    fname = f"{data_dir}{parsed_fileprefix}{census_fileA}{year}{census_fileB}"
+    (censush, rows) = read_table(fname)
+    for row in rows:
+        censusd[f"{row[1]}-{row[2]}"] = row
+
+    (demod, democols) = read_parsed_demo_file(f"{data_dir}{parsed_fileprefix}{exitpolls_fileA}{year}p{exitpolls_parsed_fileB}")
+
+    # write final data
+    fout = f"{data_dir}{interim_fileprefix}{year}p{interim_filesuffix}"
+    censush = censush[0:3] +['dem', 'rep', 'tot', 'incumbent', 'prevparty'] + censush[3:]
+    censush.extend(democols)
+    rows = []
+    for d in sorted(censusd.keys()):
+        row = censusd[d][0:3]
+        if d in votingd:
+            row.extend(votingd[d])
+            # party carrying the district last time
+            prevp = ""
+            if d in prev_votingd:
+                (pdem, prep, ptot) = prev_votingd[d]
+                prevp = 'd' if pdem > prep else 'r' if prep > pdem else ""
+            row.extend([0, prevp])
+        else:
+            row.extend([0,0,0,0,""])
+            if d != "PR-1":
+                print("NO pres results for %s %s" % (year,d))
+        row.extend(censusd[d][3:])
+        for c in democols:
+            k = c.replace(",", "_")
+            if k in demod:
+                row.append(demod[k])
+            else:
+                row.append("")
+        rows.append(row)
+    write_table(fout, rows, censush)
 
 
 
 # calculate the percentages from other fields
-# header, row, field with totals,
+# data frame, field with totals,
 # fields with nums of groups, fields with corresponding pcts
-def create_aggr_pct(h, r, ftot, fnums, fpcts):
-    # create weighted result
-    res = 0
-    for i in range(len(fnums)):
-        res += r[h.index(fnums[i])] / r[h.index(ftot)] * r[h.index(fpcts[i])]
-    return res
-
+def create_aggr_pct(df, ftot, fnums, fpcts):
+    # create weighted result, a column for every row of df
+    return poststrat.weighted_pct(df[fnums].to_numpy(), df[ftot].to_numpy(),
+                                  df[fpcts].to_numpy())
+
+
+
+# interim data of a year as a frame for normalize_house_data, with the
+# numbers as floats and the older census vote age fields filled in
+# (kind is h for house, p for presidential)
+def read_interim_year(year, kind="h"):
+    fname = f"{data_dir}{interim_fileprefix}{year}{kind}{interim_filesuffix}"
+    (votingh, rows) = read_table(fname)
+    df = pd.DataFrame(rows, columns=votingh)
+    df = df[df['state'] != "PR"]
+    # everything after prevparty is a number, missing is 0
+    nums = votingh[8:]
+    df[nums] = df[nums].replace("", 0).astype(float)
+
+    # older census does not have some fields
+    if 'voteage_pop' not in votingh:
+        df['voteage_pop'] = (df['age_18_plus'] * (df['allage_citzenpct'] / 100)).round()
+        df['voteage_m'] = (df['voteage_pop'] * (df['allage_m'] / df['age_pop'])).round()
+        df['voteage_f'] = (df['voteage_pop'] * (df['allage_f'] / df['age_pop'])).round()
+    df['cong_year'] = year
+    return df
 
 
 # Make the old data files match the 2020 one.
 # Take the raw data and normalize the columns so can model it
 # eg exit polls have diff ranges than census for age/education/race/...
 def normalize_house_data():
+    normalize_data("h", house_years)
+
+
+# normalize the interim files of kind (h or p) for years into one final file
+def normalize_data(kind, years):
     ## have the following limited demographic data for 2020 predictions
     # Gender: Male, Female
     # Age: 18-34,35-49,50-64,65+
@@ -1156,93 +1522,51 @@ def normalize_house_data():
     copy_fields = ['year', 'state', 'district', 'dem', 'rep', 'tot', 'incumbent', 'prevparty', 'voteage_pop', 'voteage_m', 'voteage_f', 'race_pop', 'race_white', 'race_nonwhite', 'ed_pop', 'ed_4y', 'ed_no4y', 'age_pop', 'age_18_34', 'age_35_49', 'age_50_64', 'age_65_plus', 'inc_pop', 'inc_lt_50', 'inc_50_100', 'inc_100_plus', "Gender,Male","Gender,Female","Age,18-34","Age,35-49","Age,50-64","Age,65 and Older","Income,Less Than $50K","Income,$50-100K","Income,$100K or More","Race,White","Race,Non-White","Education,HS or less","Education,4yrDegree",
 ]
 
-    cong_years = [2012, 2014, 2016, 2018, 2020]
-    voting_all = []
-    for year in cong_years:
-        votingh = []
-        votingd = []
-        fname = f"{data_dir}{interim_fileprefix}{year}h{interim_filesuffix}"
-        fout = f"{data_dir}{final_fileprefix}{year}h{final_filesuffix}"
-        with open(fname, 'r') as csvfile:
-            csvreader = csv.reader(csvfile)
-            calc_vote_age = False
-            for row in csvreader:
-                if row[0] == "year":
-                    votingh = row
-                    if 'voteage_pop' not in votingh:
-                        votingh.extend(['voteage_pop', 'voteage_m',
-                                        'voteage_f'])
-                        calc_vote_age = True
-                    votingh.append('race_nonwhite')
-                    votingh.append('Race,Non-White')
-                    votingh.append('ed_no4y')
-                    votingh.append('ed_4y')
-                    votingh.append('Education,4yrDegree')
-                    votingh.append('inc_lt_50')
-                    votingh.append('inc_50_100')
-                    votingh.append('inc_100_plus')
-                    votingh.append('age_18_34')
-                    votingh.append('age_35_49')
-                    votingh.append('age_50_64')
-                    votingh.append('Age,18-34')
-                    votingh.append('Age,35-49')
-                    continue
+    frames = map_years(read_interim_year, years, [kind] * len(years))
+
+    # create new fields with desired info, for all years at once
+    # (fields a year does not have are 0)
+    df = pd.concat(frames, ignore_index=True)
+    for c in df.columns[8:]:
+        if df[c].dtype == float:
+            df[c] = df[c].fillna(0)
+    for c in copy_fields:
+        if c not in df.columns:
+            df[c] = 0.0
+
+    df['race_nonwhite'] = df['race_pop'] - df['race_white']
+    df['ed_4y'] = df['ed_ba'] + df['ed_grdeg']
+    df['ed_no4y'] = df['ed_pop'] - df['ed_4y']
+    df['inc_50_100'] = df['inc_50_74'] + df['inc_75_99']
+    df['inc_100_plus'] = df['inc_100_149'] + df['inc_150_199'] + df['inc_200_plus']
+    df['inc_lt_50'] = df['inc_pop'] - df['inc_50_100'] - df['inc_100_plus']
+    df['age_18_34'] = (df['age_20_24'] + df['age_25_34'] + 2/3 * (df['age_21_plus'] - df['age_18_plus'])).round()
+    df['age_35_49'] = df['age_35_44'] + 0.5 *  df['age_45_54']
+    df['age_50_64'] = 0.5 *  df['age_45_54'] + df['age_55_59'] + df['age_60_64']
+
+    # and aggregate the polls for past years, 2020 polls already have these
+    # (but not Education,4yrDegree which stays 0)
+    past = df['cong_year'] != 2020
+    race_nonwhite_pct = create_aggr_pct(df, 'race_nonwhite', ['race_black','race_asian','race_hisp'], ["Race,Black","Race,Asian","Race,Latino"]).round()
+    z = df['race_nonwhite'] / (df['race_black'] + df['race_asian'] + df['race_hisp'])
+    df['Race,Non-White'] = np.where(past, race_nonwhite_pct * z, df['Race,Non-White'])
+    ed_4y_pct = create_aggr_pct(df, 'ed_4y', ['ed_ba', 'ed_grdeg'], ["Education,College Graduate","Education,Postgraduate"]).round()
+    df['Education,4yrDegree'] = np.where(past, ed_4y_pct, 0)
+    age_18_34_pct = ((2 * df['Age,18-29'] + df['Age,30-39']) / 3).round()
+    df['Age,18-34'] = np.where(past, age_18_34_pct, df['Age,18-34'])
+    age_35_49_pct = ((df['Age,30-39'] + 2 * df['Age,40-49']) / 3).round()
+    df['Age,35-49'] = np.where(past, age_35_49_pct, df['Age,35-49'])
+
+    cols = []
+    for i, c in enumerate(copy_fields):
+        if i > 7:
+            cols.append(df[c].astype(np.int64).tolist())
+        else:
+            cols.append(df[c].tolist())
+    voting_all = [list(r) for r in zip(*cols)]
 
-                if row[1] == "PR": continue
-
-                # create new fields with desired info
-                h = votingh
-                for i in range(8,len(row)):
-                    if row[i] != "":
-                        row[i] = float(row[i])
-                    else:
-                        row[i] = 0
-                while len(row) < len(h):
-                    row.append(0)
-
-                # older census does not have some fields
-                if (calc_vote_age):
-                    #print(row)
-                    row[h.index('voteage_pop')] = round(row[h.index('age_18_plus')] * (row[h.index('allage_citzenpct')] / 100))
-                    row[h.index('voteage_m')] = round(row[h.index('voteage_pop')] * (row[h.index('allage_m')] / row[h.index('age_pop')]))
-                    row[h.index('voteage_f')] = round(row[h.index('voteage_pop')] * (row[h.index('allage_f')] / row[h.index('age_pop')]))
-
-                row[h.index('race_nonwhite')] = row[h.index('race_pop')] - row[h.index('race_white')]
-                row[h.index('ed_4y')] = row[h.index('ed_ba')] + row[h.index('ed_grdeg')]
-                row[h.index('ed_no4y')] = row[h.index('ed_pop')] - row[h.index('ed_4y')]
-                row[h.index('inc_50_100')] = row[h.index('inc_50_74')] + row[h.index('inc_75_99')]
-                row[h.index('inc_100_plus')] = row[h.index('inc_100_149')] + row[h.index('inc_150_199')] + row[h.index('inc_200_plus')]
-                row[h.index('inc_lt_50')] = row[h.index('inc_pop')] - row[h.index('inc_50_100')] - row[h.index('inc_100_plus')]
-                row[h.index('age_18_34')] = round(row[h.index('age_20_24')] + row[h.index('age_25_34')] + 2/3 * (row[h.index('age_21_plus')] - row[h.index('age_18_plus')]))
-                row[h.index('age_35_49')] = row[h.index('age_35_44')] + 0.5 *  row[h.index('age_45_54')]
-                row[h.index('age_50_64')] = 0.5 *  row[h.index('age_45_54')] + row[h.index('age_55_59')] + row[h.index('age_60_64')]
-
-                # and aggregate the polls for past years
-                if year != 2020:
-                    row[h.index('Race,Non-White')] = round(create_aggr_pct(h, row, 'race_nonwhite', ['race_black','race_asian','race_hisp'], ["Race,Black","Race,Asian","Race,Latino"]))
-                    z = row[h.index('race_nonwhite')] / (row[h.index('race_black')] + row[h.index('race_asian')] + row[h.index('race_hisp')])
-                    row[h.index('Race,Non-White')] *= z
-
-                    row[h.index('Education,4yrDegree')] = round(create_aggr_pct(h, row, 'ed_4y', ['ed_ba', 'ed_grdeg'], ["Education,College Graduate","Education,Postgraduate"]))
-                    row[h.index('Age,18-34')] = round((2 * row[h.index('Age,18-29')] + row[h.index('Age,30-39')]) / 3)
-                    row[h.index('Age,35-49')] = round((row[h.index('Age,30-39')] + 2 * row[h.index('Age,40-49')]) / 3)
-
-                tmparr = []
-                for i, c in enumerate(copy_fields):
-                    if i > 7:
-                        tmparr.append(int(row[h.index(c)]))
-                    else:
-                        tmparr.append(row[h.index(c)])
-                votingd.append(tmparr)
-
-        voting_all.extend(votingd)
-
-    fout = f"{data_dir}{final_fileprefix}h{final_filesuffix}"
-    with open(fout, 'w') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(copy_fields)
-        for row in voting_all:
-            csvwriter.writerow(row)
+    fout = f"{data_dir}{final_fileprefix}{kind}{final_filesuffix}"
+    write_table(fout, voting_all, copy_fields)
 
     return
 
@@ -1251,37 +1575,195 @@ def normalize_house_data():
 # take the raw data and normalize the columns so can model it
 # eg exit polls have diff ranges than census for age/education/race/...
 def normalize_pres_data():
-    print("@@@TODO - normalize pres data")
-    return
+    years = [year for year in pres_years
+             if os.path.exists(f"{data_dir}{interim_fileprefix}{year}p{interim_filesuffix}")]
+    if len(years) == 0:
+        print("WARNING: no interim pres data, run join_pres_data")
+        return
+    normalize_data("p", years)
+
+
+
+### Pipeline
+
+# hashes of the inputs of each stage the last time it ran
+pipeline_state_file = "pipeline_state.json"
+
+# timing/memory of each stage run, written at the end of run_pipeline
+run_report_file = "run_report.json"
+
+# also build the presidential data (downloads the large precinct file)
+include_pres = False
+
+
+# the stages of the __main__ run, with the files each reads and writes.
+# A stage runs after any stage writing one of its inputs.
+def pipeline_stages():
+    if census_batched:
+        census_raw = [f"{census_fileA}{year}{census_fileB}"
+                      for year in parse_census_years]
+    else:
+        census_raw = [f"{census_fileA}{year}{group}{census_fileB}"
+                      for year in census_years for group in census_groups
+                      if year != 2015]
+    census_parse_raw = [f for year in parse_census_years
+                        for f in census_parse_files(year)]
+    census_parsed = [f"{parsed_fileprefix}{census_fileA}{year}{census_fileB}"
+                     for year in parse_census_years]
+    exitpolls_raw = [f"{exitpolls_fileA}{k}{exitpolls_fileB}" for k in exitpolls]
+    exitpolls_parsed = [f"{parsed_fileprefix}{exitpolls_fileA}{k}{exitpolls_parsed_fileB}"
+                        for k in exitpolls]
+    house_2020_raw = [results_2020hr_file, results_2020hm_file]
+    house_2020_parsed = f"{parsed_fileprefix}{results_2020hr_file}{res2020_parsed_fileB}"
+    poll_2020_house_parsed = f"{parsed_fileprefix}{poll_2020_house_file}"
+    interim = [f"{interim_fileprefix}{year}h{interim_filesuffix}" for year in house_years]
+
+    stages = [
+        (download_census_district, [], census_raw),
+        (download_house_results, [], [congress_file]),
+        (download_exit_polls, [], exitpolls_raw),
+        (download_2020_pres_polls, [], [poll_2020_pres_file]),
+        (download_2020_house_polls, [], [poll_2020_house_file]),
+        (download_2020_house_results, [], house_2020_raw),
+
+        ## parse the above files to pull out relevant fields
+        (parse_exit_polls, exitpolls_raw, exitpolls_parsed),
+        (parse_census_districts, census_parse_raw, census_parsed),
+        (parse_2020_house_polls, [poll_2020_house_file], [poll_2020_house_parsed]),
+        (parse_2020_house_results, house_2020_raw, [house_2020_parsed]),
+
+        ## aggregate the parsed files into files with a single record
+        (join_house_data,
+         [congress_file, poll_2020_house_parsed, house_2020_parsed] + census_parsed +
+         [f"{parsed_fileprefix}{exitpolls_fileA}{year}h{exitpolls_parsed_fileB}"
+          for year in house_years if year != 2020],
+         interim),
+
+        ## transform some columns to ensure consistency
+        (normalize_house_data, interim, [f"{final_fileprefix}h{final_filesuffix}"]),
+    ]
+    if include_pres:
+        # only the years whose precinct file is there (or downloaded below)
+        # are built, listing the others would rerun the stages every time
+        pres_downloaded = [presidential_2016_file]
+        pres_built = [year for year in pres_years
+                      if pres_files[year] in pres_downloaded or
+                      os.path.exists(f"{data_dir}{pres_files[year]}")]
+        pres_interim = [f"{interim_fileprefix}{year}p{interim_filesuffix}" for year in pres_built]
+        stages += [
+            (download_pres_results, [], pres_downloaded),
+            (join_pres_data,
+             [pres_files[year] for year in pres_years] + [pres_crosswalk_file] +
+             [f"{parsed_fileprefix}{census_fileA}{year}{census_fileB}" for year in pres_years] +
+             [f"{parsed_fileprefix}{exitpolls_fileA}{year}p{exitpolls_parsed_fileB}"
+              for year in pres_years],
+             pres_interim),
+            (normalize_pres_data, pres_interim, [f"{final_fileprefix}p{final_filesuffix}"]),
+        ]
+    return [{'name': func.__name__, 'func': func,
+             'inputs': [f"{data_dir}{f}" for f in inputs],
+             'outputs': [f"{data_dir}{f}" for f in outputs]}
+            for (func, inputs, outputs) in stages]
+
+
+# sha256 of a file's contents, None if it does not exist
+def file_hash(fname):
+    if not os.path.exists(fname):
+        return None
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# run the stages in dependency order, up to parallel of them at once.
+# A stage with inputs is skipped when its outputs exist and its inputs
+# hash the same as the last time it ran (unless rerun).  Stages without
+# inputs (downloads) always run, they skip existing files themselves.
+def run_pipeline(parallel=1, rerun=False):
+    stages = pipeline_stages()
+    writers = {}
+    for st in stages:
+        for f in st['outputs']:
+            writers[f] = st['name']
+    deps = {st['name']: {writers[f] for f in st['inputs'] if f in writers}
+            for st in stages}
+
+    fstate = f"{data_dir}{pipeline_state_file}"
+    state = {}
+    if os.path.exists(fstate):
+        with open(fstate, 'r') as infile:
+            state = json.load(infile)
+    state_lock = threading.Lock()
+
+    def run(st):
+        hashes = {f: file_hash(f) for f in st['inputs']}
+        if not rerun and len(st['inputs']) > 0 and \
+           state.get(st['name']) == hashes and \
+           all(os.path.exists(f) for f in st['outputs']):
+            print(f"Skipping {st['name']}, inputs unchanged")
+            return
+        print(f"Running {st['name']}")
+        with instrument.measure(st['name'], st['inputs'], st['outputs']):
+            st['func']()
+        with state_lock:
+            state[st['name']] = hashes
+            with open(f"{fstate}.tmp", 'w') as outfile:
+                json.dump(state, outfile, indent=1, sort_keys=True)
+            os.replace(f"{fstate}.tmp", fstate)
+
+    done = set()
+    pending = list(stages)
+    running = {}
+    try:
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            while pending or running:
+                for st in [st for st in pending if deps[st['name']] <= done]:
+                    pending.remove(st)
+                    running[pool.submit(run, st)] = st['name']
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done.add(running.pop(future))
+    finally:
+        instrument.write_report(f"{data_dir}{run_report_file}")
 
 
 
 if __name__ == '__main__':
-    download_census_district()
-    download_house_results()
+    parser = argparse.ArgumentParser(description="Download and build the election data sets")
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="independent stages run at once")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processes for the per-year parse/join/normalize work")
+    parser.add_argument("--rerun", action="store_true",
+                        help="run every stage even if its inputs did not change")
+    parser.add_argument("--refresh", action="store_true",
+                        help="revalidate existing downloads with the servers")
+    parser.add_argument("--census-batched", action="store_true",
+                        help="download only the needed census fields, one file per year")
+    parser.add_argument("--pres", action="store_true",
+                        help="also build the presidential data from the precinct files")
+    parser.add_argument("--count-rows", action="store_true",
+                        help="count csv rows in the run report (reads every file in full)")
+    downloader.add_source_arguments(parser)
+    args = parser.parse_args()
+    downloader.use_source_arguments(args)
+    instrument.count_rows = args.count_rows
+    refresh_downloads = args.refresh
+    include_pres = args.pres
+    census_batched = args.census_batched
+    jobs = args.jobs
+
     #download_pres_results()
     # #### Not using this anymore, using per-district instead of per-county
     # ##download_pres_county_results()
-    download_exit_polls()
-    download_2020_pres_polls()
-    download_2020_house_polls()
-    download_2020_house_results()
     #download_2020_pres_results()
-
-    ## parse the above files to pull out relevant fields
-    parse_exit_polls()
-    parse_census_districts()
-    parse_2020_house_polls()
-    parse_2020_house_results()
     #parse_2020_pres_files()
-
-    ## aggregate the parsed files into files with a single record
-    join_house_data()
     #join_pres_data()
-
-    ## transform some columns to ensure consistency
-    normalize_house_data()
     #normalize_pres_data()
+    run_pipeline(args.parallel, args.rerun)
 
 
 #add per-district presidential data (join_pres_data)
@@ -1,14 +1,14 @@
+import argparse
 import csv
 import json
 import os.path
-import re
-import requests
-import sys
+
+import downloader
 
 def fetch_to_csv(url, filename, clobber=False):
     if not clobber and os.path.exists(filename):
         return None
-    response = requests.get(url)
+    response = downloader.get(url)
     with open(filename, 'w') as csvfile:
         csvwriter = csv.writer(csvfile)
         try:
@@ -33,21 +33,21 @@ def census_county(year, filename):
     censuscounty_urlA = "https://api.census.gov/data/"
     censuscounty_urlB = "/acs/acs1/profile?get=NAME,group(DP02)&for=county:*"
     url = f"{censuscounty_urlA}{year}{censuscounty_urlB}"
-    fetch_to_csv(url, fname)
+    fetch_to_csv(url, filename)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 1:
-        print("include a year and either 'county' or nothing for congressional");
-        exit()
-    year = sys.argv[1]
-    if not re.match(r"^\d{4}$",year):
-        print("That doesn't look like a four-digit year: {}".format(year))
-        exit()
-    if not int(year) < 2020:
-        print("Year must be less than 2020.")
-        exit()
-    if len(sys.argv) > 2:
+    parser = argparse.ArgumentParser(description="Fetch census DP02 data by congressional district or county")
+    parser.add_argument("year", type=int, help="four-digit year, before 2020")
+    parser.add_argument("county", nargs="?", choices=["county"],
+                        help="by county instead of congressional district")
+    downloader.add_source_arguments(parser)
+    args = parser.parse_args()
+    if not 1000 <= args.year < 2020:
+        parser.error(f"year must be a four-digit year less than 2020: {args.year}")
+    downloader.use_source_arguments(args)
+    year = args.year
+    if args.county:
         print("County for {}".format(year))
         census_county(year, "data/census_by_county_{}.csv".format(year))
     else:
@@ -1,84 +1,49 @@
-import os, csv, re, requests, time
-from bs4 import BeautifulSoup
+import argparse, importlib.util, os, csv, sys
+from bs4 import BeautifulSoup, SoupStrainer
+
+import districts
+import downloader
+
+# politico puts each district in one of these
+leaderboard_class = "jsx-3350511208 leaderboard"
+
+# house_page_rows backends:
+#   "full"     - build the whole page with the pure python html.parser
+#   "strained" - only build the leaderboard tables, with lxml if installed
+html_backend = "strained"
+strained_parser = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+
+# delegates' seats, politico has house pages for the 50 states and DC
+territories = ['AS', 'GU', 'MP', 'PR', 'VI']
 
 def states():
-    return { 'Alabama': 'AL',
-             'Alaska': 'AK',
-             'American Samoa': 'AS',
-             'Arizona': 'AZ',
-             'Arkansas': 'AR',
-             'California': 'CA',
-             'Colorado': 'CO',
-             'Connecticut': 'CT',
-             'Delaware': 'DE',
-             'District of Columbia': 'DC',
-             'Florida': 'FL',
-             'Georgia': 'GA',
-             'Guam': 'GU',
-             'Hawaii': 'HI',
-             'Idaho': 'ID',
-             'Illinois': 'IL',
-             'Indiana': 'IN',
-             'Iowa': 'IA',
-             'Kansas': 'KS',
-             'Kentucky': 'KY',
-             'Louisiana': 'LA',
-             'Maine': 'ME',
-             'Maryland': 'MD',
-             'Massachusetts': 'MA',
-             'Michigan': 'MI',
-             'Minnesota': 'MN',
-             'Mississippi': 'MS',
-             'Missouri': 'MO',
-             'Montana': 'MT',
-             'Nebraska': 'NE',
-             'Nevada': 'NV',
-             'New Hampshire': 'NH',
-             'New Jersey': 'NJ',
-             'New Mexico': 'NM',
-             'New York': 'NY',
-             'North Carolina': 'NC',
-             'North Dakota': 'ND',
-             'Northern Mariana Islands':'MP',
-             'Ohio': 'OH',
-             'Oklahoma': 'OK',
-             'Oregon': 'OR',
-             'Pennsylvania': 'PA',
-             'Puerto Rico': 'PR',
-             'Rhode Island': 'RI',
-             'South Carolina': 'SC',
-             'South Dakota': 'SD',
-             'Tennessee': 'TN',
-             'Texas': 'TX',
-             'Utah': 'UT',
-             'Vermont': 'VT',
-             'Virgin Islands': 'VI',
-             'Virginia': 'VA',
-             'Washington': 'WA',
-             'West Virginia': 'WV',
-             'Wisconsin': 'WI',
-             'Wyoming': 'WY'
-    }
+    return {name: abbrev for (name, abbrev) in districts.state_abbrev.items()
+            if abbrev not in territories}
 
 def parse_district_name(district_name):
     # Return state-code and number (or 1 for At-Large)
-    m = re.match("(.*)'s? At-large district", district_name)
-    state, district = None, None
-    if m:
-        state = states()[m.group(1)]
-        district = 1
+    return districts.parse_politico_name(district_name)
+
+def state_url_name(state):
+    if state == "District of Columbia":
+        state = "Washington DC"
+    return state.lower().replace(" ", "-")
+
+def house_url(state_name):
+    return "https://www.politico.com/2020-election/results/{}/house/".format(state_name)
+
+def leaderboard_tables(content, backend):
+    if backend == "strained":
+        soup = BeautifulSoup(content, strained_parser,
+                             parse_only=SoupStrainer(class_=leaderboard_class))
     else:
-        m = re.match("(.*)'s? (\d+)(\w+) district", district_name)
-        if m:
-            state = states()[m.group(1)]
-            district = m.group(2)
-    return state, district
+        soup = BeautifulSoup(content, 'html.parser')
+    return soup.find_all(class_=leaderboard_class)
 
-def house_one_state(state_name, csvwriter):
-    url = "https://www.politico.com/2020-election/results/{}/house/".format(state_name)
-    page = requests.get(url)
-    soup = BeautifulSoup(page.content, 'html.parser')
-    tables = soup.find_all(class_="jsx-3350511208 leaderboard")
+def house_page_rows(content, backend=None):
+    # Return one csv row per district table on a politico state page
+    result = []
+    tables = leaderboard_tables(content, backend or html_backend)
     for i in range(len(tables)):
         table = tables[i]
         district = table.find(class_="heading").text
@@ -105,25 +70,64 @@ def house_one_state(state_name, csvwriter):
                 vals["{}:num".format(party)] = int(num.replace(",", ""))
                 vals["{}:pct".format(party)] = float(pct.replace("%", ""))
         state, distno = parse_district_name(district)
-        csvwriter.writerow([district, "{}-{:02d}".format(state, int(distno)),
-                            vals.setdefault("dem:candidate", ""),
-                            vals.setdefault("gop:candidate", ""),
-                            vals.setdefault("dem:num", 0),
-                            vals.setdefault("gop:num", 0),
-                            vals.setdefault("dem:pct", 0),
-                            vals.setdefault("gop:pct", 0)])
+        result.append([district, "{}-{:02d}".format(state, int(distno)),
+                       vals.setdefault("dem:candidate", ""),
+                       vals.setdefault("gop:candidate", ""),
+                       vals.setdefault("dem:num", 0),
+                       vals.setdefault("gop:num", 0),
+                       vals.setdefault("dem:pct", 0),
+                       vals.setdefault("gop:pct", 0)])
+    return result
+
+def house_one_state(state_name, csvwriter):
+    page = downloader.get(house_url(state_name))
+    for row in house_page_rows(page.content):
+        csvwriter.writerow(row)
+
+# rows of a downloaded state page, failing on an http error page
+def state_page_rows(page):
+    page.raise_for_status()
+    return house_page_rows(page.content)
+
+def house_all_states(workers):
+    # Fetch and parse the states concurrently on the shared session, rows
+    # come back in states() order whatever order the pages finish in.
+    # Raises RuntimeError naming the states that failed.
+    names = list(states().keys())
+    jobs = [(house_url(state_url_name(state)), state_page_rows) for state in names]
+    results = downloader.download_all(jobs, workers)
+    failed = [state for (state, rows) in zip(names, results) if rows is None]
+    if failed:
+        raise RuntimeError(f"failed to download or parse {', '.join(failed)}")
+    return [row for rows in results for row in rows]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape 2020 house results from politico")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="states fetched at once (1 is serial)")
+    parser.add_argument("--delay", type=float, default=0.5,
+                        help="min seconds between requests to politico")
+    parser.add_argument("--backend", choices=["full", "strained"], default=html_backend,
+                        help="html parsing backend")
+    downloader.add_source_arguments(parser)
+    args = parser.parse_args()
+    downloader.use_source_arguments(args)
+    html_backend = args.backend
+    downloader.host_delay['www.politico.com'] = args.delay
+
+    # all states or nothing, a partial file is never written
+    try:
+        rows = house_all_states(args.workers)
+    except RuntimeError as e:
+        print(f"ERROR: {e}, not writing results")
+        sys.exit(1)
+
     fname = "data/2020-house.csv"
-    with open(fname, 'w') as csvfile:
+    with open(f"{fname}.part", 'w') as csvfile:
         csvwriter = csv.writer(csvfile)
         csvwriter.writerow(["district-name", "district", "dem-candidate", "gop-candidate",
                             "dem-num", "gop-num", "dem-pct", "gop-pct"])
-        for state in states().keys():
-            time.sleep(0.5)
-            print("State: {}".format(state))
-            if state == "District of Columbia":
-                state = "Washington DC"
-            state_url = state.lower().replace(" ", "-")
-            house_one_state(state_url, csvwriter)
+        for row in rows:
+            csvwriter.writerow(row)
+    os.replace(f"{fname}.part", fname)
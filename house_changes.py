@@ -9,25 +9,16 @@ def read_r_file(year):
         state_abb,district,total_votes,dem,other,rep
        and the dem,other, and rep columns are percentage (0,1) with NA sometimes.
     """
-    def district(row):
-        return "{}-{:02d}".format(row['state_abb'], row['district'])
-
-    def winner(row):
-        if (row['dem'] > row['rep']):
-            return "D"
-        elif (row['rep'] > row['dem']):
-            return "R"
-        elif (row['dem'] > 0 and np.isnan(row['rep'])):
-            return "D"
-        elif (row['rep'] > 0 and np.isnan(row['dem'])):
-            return "R"
-        else:
-            return None
-
     df = pd.read_csv("{}/{}.all.house.csv".format(data_dir, year))
     df.loc[df.district == 0, "district"] = 1
-    df[year] = df.apply(winner, axis=1)
-    df["district"] = df.apply(district, axis=1)
+    dem, rep = df['dem'], df['rep']
+    # Comparisons with NA are false, so a missing share only loses to a positive one.
+    df[year] = np.select([dem > rep,
+                          rep > dem,
+                          (dem > 0) & rep.isna(),
+                          (rep > 0) & dem.isna()],
+                         ["D", "R", "D", "R"], default=None)
+    df["district"] = df['state_abb'] + "-" + df['district'].astype(int).astype(str).str.zfill(2)
     df = df.set_index("district")
     return df[[year]]
 
@@ -38,23 +29,18 @@ def read_2020_file():
     In this case, sometimes, the numbers are all zeros and you need to use whether there is
     an asterisk in the candidate name to determine which party won.
     """
-    def winner(row):
-        if (str(row['dem-candidate']).find("*") > 0) or (row['dem-num'] > row['gop-num']):
-            return "D"
-        elif str(row['gop-candidate']).find("*") > 0 or (row['gop-num'] > row['dem-num']):
-            return "R"
-        else:
-            return None
-
     df = pd.read_csv("{}/{}.csv".format(data_dir, "2020-house"))
-    df["2020"] = df.apply(winner, axis=1)
+    dem_star = df['dem-candidate'].astype(str).str.find("*") > 0
+    gop_star = df['gop-candidate'].astype(str).str.find("*") > 0
+    df["2020"] = np.select([dem_star | (df['dem-num'] > df['gop-num']),
+                            gop_star | (df['gop-num'] > df['dem-num'])],
+                           ["D", "R"], default=None)
     df = df.set_index("district")
     return df[["2020"]]
 
 
 def combined_df():
+    """All the years side by side, one row per 2020 district."""
     current = read_2020_file()
-    for i in ["2018", "2016", "2014", "2012"]:
-        d = read_r_file(i)
-        current = current.join(d)
-    return current
+    others = [read_r_file(i) for i in ["2018", "2016", "2014", "2012"]]
+    return current.join(others, how="left")
@@ -0,0 +1,131 @@
+## Timing and memory instrumentation for the fetch.py stages.
+##
+##   with instrument.measure("parse_exit_polls", inputs, outputs):
+##       parse_exit_polls()
+##   instrument.write_report("data/run_report.json")
+##
+## Each measured stage records wall and cpu time, bytes downloaded, the
+## bytes (and with count_rows the csv rows) of its input and output files
+## and the peak RSS.  The cpu time includes worker processes that exited
+## during the stage (the map_years pools).  Bytes downloaded and cpu time
+## are process wide, so stages running at the same time (--parallel) see
+## each other's.  The peak RSS is the process high-water mark, so a stage
+## records the peak so far (cumulative_peak_rss_mb) and how much it raised
+## it (peak_rss_increase_mb), the increase being 0 for a stage that stayed
+## under an earlier stage's peak.
+##
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import downloader
+
+_records = []
+_records_lock = threading.Lock()
+_started = time.time()
+
+# count the rows of csv inputs/outputs, off by default as it reads every
+# file in full, before and after the stage (fetch.py --count-rows)
+count_rows = False
+
+
+# cpu seconds used by this process and its reaped children
+def cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+# peak resident set size so far in MB, of this process and of the
+# largest child.  None where the resource module is missing (windows).
+def peak_rss_mb():
+    if resource is None:
+        return None, None
+    # ru_maxrss is in KB on linux and bytes on macos
+    unit = 1 << 20 if sys.platform == "darwin" else 1 << 10
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
+
+# size of a file, with the row count for csv files if count_rows
+def file_stats(fname):
+    if not os.path.exists(fname):
+        return {'file': fname, 'bytes': None, 'rows': None}
+    rows = None
+    if count_rows and fname.endswith(".csv"):
+        with open(fname, 'rb') as infile:
+            rows = sum(1 for line in infile)
+    return {'file': fname, 'bytes': os.path.getsize(fname), 'rows': rows}
+
+
+def total(stats, key):
+    return sum(s[key] for s in stats if s[key] is not None)
+
+
+# record a stage run, input/output files are optional
+@contextmanager
+def measure(name, inputs=(), outputs=()):
+    record = {'name': name,
+              'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              'ok': False}
+    in_stats = [file_stats(f) for f in inputs]
+    (rss_start, child_rss_start) = peak_rss_mb()
+    bytes_start = downloader.bytes_downloaded()
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    try:
+        yield record
+        record['ok'] = True
+    finally:
+        record['wall_seconds'] = time.perf_counter() - wall_start
+        record['cpu_seconds'] = cpu_seconds() - cpu_start
+        record['bytes_downloaded'] = downloader.bytes_downloaded() - bytes_start
+        out_stats = [file_stats(f) for f in outputs]
+        if count_rows:
+            record['rows_in'] = total(in_stats, 'rows')
+            record['rows_out'] = total(out_stats, 'rows')
+        record['bytes_in'] = total(in_stats, 'bytes')
+        record['bytes_out'] = total(out_stats, 'bytes')
+        (rss, child_rss) = peak_rss_mb()
+        record['cumulative_peak_rss_mb'] = rss
+        record['cumulative_peak_child_rss_mb'] = child_rss
+        if rss is not None:
+            record['peak_rss_increase_mb'] = rss - rss_start
+            record['peak_child_rss_increase_mb'] = child_rss - child_rss_start
+        record['inputs'] = in_stats
+        record['outputs'] = out_stats
+        with _records_lock:
+            _records.append(record)
+
+
+# stage records so far, in the order they finished
+def records():
+    with _records_lock:
+        return list(_records)
+
+
+def report():
+    stages = records()
+    rss, child_rss = peak_rss_mb()
+    return {'started': datetime.fromtimestamp(_started, timezone.utc).isoformat(timespec='seconds'),
+            'wall_seconds': time.time() - _started,
+            'cpu_seconds': cpu_seconds(),
+            'bytes_downloaded': downloader.bytes_downloaded(),
+            'peak_rss_mb': rss,
+            'peak_child_rss_mb': child_rss,
+            'stages': stages}
+
+
+def write_report(fname):
+    with open(f"{fname}.tmp", 'w') as outfile:
+        json.dump(report(), outfile, indent=1)
+    os.replace(f"{fname}.tmp", fname)
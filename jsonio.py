@@ -0,0 +1,103 @@
+## Json reading and writing for the fetch scripts.
+##
+## loads/dumps use orjson when it is installed (several times faster at
+## decoding the large politico and CNN files) and the json module
+## otherwise.  iter_items streams the items of the arrays in a json
+## document, with ijson for files over stream_min_bytes so they are not
+## loaded whole.  The json lines (.jsonl) files hold one record per line,
+## so they can be appended to and read a record at a time.
+##
+
+import json
+import os
+import threading
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# decode/encode with orjson, set False to use the json module
+use_orjson = orjson is not None
+
+# files at least this size are streamed with ijson (when installed),
+# smaller ones are decoded whole, which is faster
+stream_min_bytes = 64 << 20
+
+_append_lock = threading.Lock()
+
+
+# decode json from str or bytes
+def loads(data):
+    if use_orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# json of obj on one line, as bytes
+def dumps(obj):
+    if use_orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def load(infile):
+    return loads(infile.read())
+
+
+# items of the arrays at prefixes in the json document infile (opened
+# binary), as (prefix, item) in document order.  Prefixes are ijson style,
+# eg 'races.item' for each element of the top level 'races' array and
+# 'item' for each element of a top level array.
+def iter_items(infile, prefixes):
+    prefixes = set(prefixes)
+    if ijson is None or os.fstat(infile.fileno()).st_size < stream_min_bytes:
+        yield from walk_items(load(infile), "", prefixes)
+        return
+    builder = None
+    for prefix, event, value in ijson.parse(infile, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == current and event in ['end_map', 'end_array']:
+                yield current, builder.value
+                builder = None
+        elif prefix in prefixes:
+            if event in ['start_map', 'start_array']:
+                current = prefix
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif event not in ['end_map', 'end_array']:
+                yield prefix, value
+
+
+# iter_items over an already loaded document
+def walk_items(data, prefix, prefixes):
+    if isinstance(data, dict):
+        for k, v in data.items():
+            yield from walk_items(v, f"{prefix}.{k}" if prefix else k, prefixes)
+    elif isinstance(data, list):
+        item = f"{prefix}.item" if prefix else "item"
+        for v in data:
+            if item in prefixes:
+                yield item, v
+            else:
+                yield from walk_items(v, item, prefixes)
+
+
+# records of a json lines file, one at a time
+def iter_jsonl(fname):
+    with open(fname, 'rb') as infile:
+        for line in infile:
+            if line.strip():
+                yield loads(line)
+
+
+def append_jsonl(fname, record):
+    with _append_lock:
+        with open(fname, 'ab') as outfile:
+            outfile.write(dumps(record) + b"\n")
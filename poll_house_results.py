@@ -0,0 +1,110 @@
+## Poll the live politico 2020 house results on election night.
+##
+##   python poll_house_results.py --interval 5
+##
+## Re-fetches fetch.results_2020hr_url every interval seconds.  The
+## request is conditional, so an unchanged file costs a 304.  Each poll
+## compares the candidate votes of every race with the previous poll.
+## Only the races that changed are appended to the delta log (json lines)
+## and to the parsed 2020 house results csv.  join_house_2020 keeps the
+## last row of each district.  The first poll rewrites the parsed csv
+## with every race.
+##
+
+import argparse
+import csv
+import os
+import time
+from datetime import datetime, timezone
+
+import downloader
+import fetch
+import jsonio
+
+# json lines of {time, raceid, votes, row} for every changed race
+delta_file = "2020_house.deltas.jsonl"
+
+
+# download_all handler saving the results file and returning its races
+def save_races(fname):
+    def save(response):
+        response.raise_for_status()
+        content = response.content
+        with open(f"{fname}.part", 'wb') as outfile:
+            outfile.write(content)
+        os.replace(f"{fname}.part", fname)
+        return jsonio.loads(content)['races']
+    return save
+
+
+# candidate votes of a race, to compare between polls
+def race_votes(r):
+    return {c['candidateID']: c['vote'] for c in r['candidates']}
+
+
+# races whose votes differ from snapshot, updating snapshot
+def changed_races(races, snapshot):
+    changed = []
+    for r in races:
+        votes = race_votes(r)
+        if snapshot.get(r['raceid']) != votes:
+            snapshot[r['raceid']] = votes
+            changed.append(r)
+    return changed
+
+
+def poll(snapshot, mlookup, clookup):
+    fname = f"{fetch.data_dir}{fetch.results_2020hr_file}"
+    fparsed = f"{fetch.data_dir}{fetch.parsed_fileprefix}{fetch.results_2020hr_file}{fetch.res2020_parsed_fileB}"
+    fdelta = f"{fetch.data_dir}{delta_file}"
+
+    # unconditional until there is a snapshot to compare against, the
+    # validators are remembered either way for the next poll
+    job = (fetch.results_2020hr_url, save_races(fname), fname, bool(snapshot))
+    races = downloader.download_all([job])[0]
+    if races is None or races is downloader.NOT_MODIFIED:
+        return 0
+
+    first = not snapshot
+    changed = changed_races(races, snapshot)
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    rows = []
+    for r in changed:
+        row = fetch.house_2020_row(r, mlookup, clookup)
+        rows.append(row)
+        jsonio.append_jsonl(fdelta, {'time': now, 'raceid': r['raceid'],
+                                     'votes': snapshot[r['raceid']], 'row': row})
+    if first:
+        fetch.write_table(fparsed, rows)
+    elif rows:
+        with open(fparsed, 'a') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            for row in rows:
+                csvwriter.writerow(row)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll the live 2020 house results")
+    parser.add_argument("--interval", type=float, default=10,
+                        help="seconds between polls")
+    parser.add_argument("--count", type=int, default=0,
+                        help="stop after this many polls (0 polls until stopped)")
+    downloader.add_source_arguments(parser)
+    args = parser.parse_args()
+    downloader.use_source_arguments(args)
+    downloader.show_progress = False
+
+    # race and candidate metadata does not change during the night
+    fetch.download_2020_house_results()
+    (mlookup, clookup) = fetch.house_2020_meta(f"{fetch.data_dir}{fetch.results_2020hm_file}")
+
+    snapshot = {}
+    n = 0
+    while args.count == 0 or n < args.count:
+        start = time.monotonic()
+        changed = poll(snapshot, mlookup, clookup)
+        n += 1
+        print(f"{datetime.now().strftime('%H:%M:%S')} {changed} races changed")
+        if args.count == 0 or n < args.count:
+            time.sleep(max(0, args.interval - (time.monotonic() - start)))
@@ -0,0 +1,149 @@
+## Demographic post-stratification of the exit poll margins to districts.
+##
+##   python poststrat.py
+##
+## The district populations of each demographic group (built in
+## fetch.normalize_house_data) become a districts x groups share matrix,
+## and the dem-rep margin of each group from the polls of a year a vector.
+## A district's predicted margin is, for every dimension (gender, age,
+## income, race, education), the population weighted margin of its
+## groups, averaged over the dimensions.  That is the share matrix times
+## the margins, so any number of districts, years and alternative polls
+## are scored in one matrix product.  A dimension with a group the polls
+## of a year do not have (missing_polls) is left out of that year's
+## average rather than counted with a margin of 0.
+##
+
+import argparse
+import numpy as np
+import pandas as pd
+
+data_dir = "data/"
+final_file = "final_data_h.csv"
+poststrat_file = "poststrat_h.csv"
+
+# dimension: (population column, [(group population column, poll column)])
+dimensions = {
+    'gender': ('voteage_pop', [('voteage_m', "Gender,Male"),
+                               ('voteage_f', "Gender,Female")]),
+    'age': ('age_pop', [('age_18_34', "Age,18-34"),
+                        ('age_35_49', "Age,35-49"),
+                        ('age_50_64', "Age,50-64"),
+                        ('age_65_plus', "Age,65 and Older")]),
+    'income': ('inc_pop', [('inc_lt_50', "Income,Less Than $50K"),
+                           ('inc_50_100', "Income,$50-100K"),
+                           ('inc_100_plus', "Income,$100K or More")]),
+    'race': ('race_pop', [('race_white', "Race,White"),
+                          ('race_nonwhite', "Race,Non-White")]),
+    'education': ('ed_pop', [('ed_no4y', "Education,HS or less"),
+                             ('ed_4y', "Education,4yrDegree")]),
+}
+
+
+# poll columns a year's polls do not have (0 in final_data_h), the 2020
+# polls have no college graduate margin
+missing_polls = {
+    2020: ["Education,4yrDegree"],
+}
+
+
+# poll columns in share matrix order
+def group_columns(dims=None):
+    dims = dimensions if dims is None else dims
+    return [p for (pop, groups) in dims.values() for (c, p) in groups]
+
+
+# weighted percent of each row, sum over i of counts[:,i] / total * pcts[:,i]
+#   counts, pcts: rows x groups arrays, total: rows
+# (fetch.create_aggr_pct, summing in the same order as it always has)
+def weighted_pct(counts, total, pcts):
+    res = 0
+    for i in range(counts.shape[1]):
+        res = res + counts[:, i] / total * pcts[:, i]
+    return res
+
+
+# dimensions whose groups have poll margins in every year
+def complete_dimensions(dims=None):
+    dims = dimensions if dims is None else dims
+    missing = {p for cols in missing_polls.values() for p in cols}
+    return {d: (pop, groups) for (d, (pop, groups)) in dims.items()
+            if not any(p in missing for (c, p) in groups)}
+
+
+# rows x dimensions mask of the dimensions the polls of each row's year
+# have all the groups of (all of them where df has no year)
+def present_dimensions(df, dims=None):
+    dims = dimensions if dims is None else dims
+    present = np.ones((len(df), len(dims)), dtype=bool)
+    if 'year' not in df.columns:
+        return present
+    years = df['year'].to_numpy()
+    for (year, cols) in missing_polls.items():
+        for j, (pop, groups) in enumerate(dims.values()):
+            if any(p in cols for (c, p) in groups):
+                present[years == year, j] = False
+    return present
+
+
+# districts x groups matrix of the share of each group in its dimension,
+# divided by the number of dimensions present in the row's year so a row
+# sums to 1 (0 where none is)
+def share_matrix(df, dims=None):
+    dims = dimensions if dims is None else dims
+    blocks = []
+    for (pop, groups) in dims.values():
+        counts = df[[c for (c, p) in groups]].to_numpy(dtype=float)
+        total = df[pop].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            blocks.append(np.where(total[:, None] > 0, counts / total[:, None], 0.0))
+    present = present_dimensions(df, dims)
+    n = present.sum(axis=1, keepdims=True)
+    weights = present / np.where(n > 0, n, 1)
+    sizes = [len(groups) for (pop, groups) in dims.values()]
+    return np.hstack(blocks) * np.repeat(weights, sizes, axis=1)
+
+
+# years x groups margins of the polls, from the poll columns (the same
+# for every district of a year)
+def margins_by_year(df, dims=None):
+    cols = group_columns(dims)
+    return df.groupby('year')[cols].first().astype(float)
+
+
+# predicted margins, shares @ margins
+#   margins: groups (one prediction per district)
+#            or groups x k (k alternative polls, districts x k predictions)
+def predict(shares, margins):
+    return shares @ np.asarray(margins, dtype=float)
+
+
+# predicted margin of every row of df with the polls of its own year,
+# NaN where the year has none of the dimensions
+def predict_all(df, dims=None):
+    shares = share_matrix(df, dims)
+    margins = margins_by_year(df, dims)
+    rows = margins.index.get_indexer(df['year'])
+    pred = np.einsum('ij,ij->i', shares, margins.to_numpy()[rows])
+    return np.where(present_dimensions(df, dims).any(axis=1), pred, np.nan)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post-stratify the poll margins to the districts")
+    parser.add_argument("--input", default=f"{data_dir}{final_file}")
+    parser.add_argument("--output", default=f"{data_dir}{poststrat_file}")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input, keep_default_na=False)
+    out = df[['year', 'state', 'district']].copy()
+    out['pred_margin'] = predict_all(df)
+    for name, dim in dimensions.items():
+        out[f"pred_{name}"] = predict_all(df, {name: dim})
+    tot = df['tot'].where(df['tot'] > 0)
+    out['actual_margin'] = (100 * (df['dem'] - df['rep']) / tot).fillna(0)
+    out.to_csv(args.output, index=False)
+
+    contested = (df['dem'] > 0) & (df['rep'] > 0)
+    right = (np.sign(out['pred_margin']) == np.sign(out['actual_margin']))[contested]
+    for year, r in right.groupby(df['year'][contested]):
+        print(f"{year}: winner right in {r.mean():.1%} of {len(r)} contested districts")
@@ -0,0 +1,165 @@
+## Monte Carlo house seat simulator over final_data_h.csv.
+##
+##   python simulate.py --year 2020 --draws 100000 --jobs 4
+##
+## Each draw's district margin (dem minus rep share of the two party vote)
+##   base margin + national swing + state swing + district noise
+## with normal swings, so the districts of a state move together and all
+## of them move with the nation.  The base margin is the district's
+## two party margin the cycle before (or comes from --margins).
+##
+## Draws run in chunks of chunk_size as districts x draws arrays, each
+## chunk with its own seed spawned from --seed, so memory stays bounded
+## and the results are the same for any --jobs.
+##
+
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+data_dir = "data/"
+final_file = "final_data_h.csv"
+
+# draws per chunk, memory is about districts * chunk_size * 4 bytes a few times
+chunk_size = 10000
+
+# standard deviations of the swings, in two party margin
+national_sd = 0.03
+state_sd = 0.02
+district_sd = 0.05
+
+# base margin where the district had no two party result the cycle before,
+# toward the party holding it
+default_margin = 0.1
+
+
+# two party margin from dem/rep votes, 0 where neither has votes
+def two_party_margin(dem, rep):
+    tot = dem + rep
+    return np.where(tot > 0, (dem - rep) / np.where(tot > 0, tot, 1), 0.0)
+
+
+# districts of year with their base margin, from the cycle before
+def base_margins(df, year):
+    cur = df[df['year'] == year][['state', 'district', 'prevparty']]
+    prev = df[df['year'] == year - 2][['state', 'district', 'dem', 'rep']]
+    prev = prev.assign(margin=two_party_margin(prev['dem'].to_numpy(float),
+                                               prev['rep'].to_numpy(float)))
+    base = cur.merge(prev[['state', 'district', 'margin', 'dem', 'rep']],
+                     on=['state', 'district'], how='left')
+    missing = base['margin'].isna() | ((base['dem'] == 0) & (base['rep'] == 0))
+    fallback = np.select([base['prevparty'] == 'd', base['prevparty'] == 'r'],
+                         [default_margin, -default_margin], 0.0)
+    base['margin'] = np.where(missing, fallback, base['margin'])
+    return base[['state', 'district', 'margin']].reset_index(drop=True)
+
+
+# districts with their base margin from a csv of state,district,margin
+def read_margins(fname):
+    return pd.read_csv(fname, usecols=['state', 'district', 'margin'])
+
+
+# draws seats for one chunk
+#   margins: base margin of each district
+#   states: index of each district's state, 0..nstates-1
+#   sds: national, state and district swing sds (passed, as worker
+#        processes may not see the globals set in __main__)
+# returns the count of draws by dem seats won, and the dem wins by district
+def simulate_chunk(margins, states, nstates, draws, seed, sds):
+    (national_sd, state_sd, district_sd) = sds
+    rng = np.random.default_rng(seed)
+    ndistricts = len(margins)
+    national = rng.standard_normal(draws, dtype=np.float32) * national_sd
+    state = rng.standard_normal((nstates, draws), dtype=np.float32) * state_sd
+    sim = rng.standard_normal((ndistricts, draws), dtype=np.float32)
+    sim *= district_sd
+    sim += margins.astype(np.float32)[:, None]
+    sim += national[None, :]
+    sim += state[states]
+    wins = sim > 0
+    seats = np.bincount(wins.sum(axis=0), minlength=ndistricts + 1)
+    return seats, wins.sum(axis=1)
+
+
+# draws seats in chunks, in jobs processes
+def simulate(margins, states, draws, seed=None, jobs=1):
+    margins = np.asarray(margins, dtype=np.float64)
+    states = np.asarray(states)
+    nstates = int(states.max()) + 1 if len(states) > 0 else 0
+    nchunks = -(-draws // chunk_size)
+    sizes = [min(chunk_size, draws - i * chunk_size) for i in range(nchunks)]
+    seeds = np.random.SeedSequence(seed).spawn(nchunks)
+    sds = (national_sd, state_sd, district_sd)
+    args = ([margins] * nchunks, [states] * nchunks, [nstates] * nchunks, sizes, seeds,
+            [sds] * nchunks)
+    if jobs > 1 and nchunks > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(simulate_chunk, *args))
+    else:
+        results = list(map(simulate_chunk, *args))
+    seats = np.zeros(len(margins) + 1, dtype=np.int64)
+    wins = np.zeros(len(margins), dtype=np.int64)
+    for (s, w) in results:
+        seats += s
+        wins += w
+    return seats, wins
+
+
+# argparse type of a count that must be at least 1
+def positive_int(value):
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return n
+
+
+# value at quantile q of a histogram
+def hist_quantile(counts, q):
+    return int(np.searchsorted(np.cumsum(counts), q * counts.sum()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate house seat distributions")
+    parser.add_argument("--year", type=int, default=2020)
+    parser.add_argument("--draws", type=positive_int, default=100000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="processes to run the chunks of draws in")
+    parser.add_argument("--margins",
+                        help="csv of state,district,margin to use as the base margins")
+    parser.add_argument("--national-sd", type=float, default=national_sd)
+    parser.add_argument("--state-sd", type=float, default=state_sd)
+    parser.add_argument("--district-sd", type=float, default=district_sd)
+    parser.add_argument("--chunk-size", type=positive_int, default=chunk_size)
+    args = parser.parse_args()
+    national_sd = args.national_sd
+    state_sd = args.state_sd
+    district_sd = args.district_sd
+    chunk_size = args.chunk_size
+
+    if args.margins:
+        base = read_margins(args.margins)
+    else:
+        df = pd.read_csv(f"{data_dir}{final_file}",
+                         usecols=['year', 'state', 'district', 'dem', 'rep', 'prevparty'],
+                         keep_default_na=False)
+        base = base_margins(df, args.year)
+    states = pd.factorize(base['state'])[0]
+
+    seats, wins = simulate(base['margin'].to_numpy(), states, args.draws,
+                           args.seed, args.jobs)
+
+    ndistricts = len(base)
+    majority = ndistricts // 2 + 1
+    mean = (np.arange(ndistricts + 1) * seats).sum() / args.draws
+    print(f"{args.draws} draws over {ndistricts} districts")
+    print(f"dem seats: mean {mean:.1f}, median {hist_quantile(seats, 0.5)}, "
+          f"90% {hist_quantile(seats, 0.05)}-{hist_quantile(seats, 0.95)}")
+    print(f"P(dem majority, {majority}+ seats) = {seats[majority:].sum() / args.draws:.3f}")
+
+    fout = f"{data_dir}sim_seats_{args.year}.csv"
+    pd.DataFrame({'dem_seats': np.arange(ndistricts + 1), 'draws': seats,
+                  'prob': seats / args.draws}).to_csv(fout, index=False)
+    fout = f"{data_dir}sim_districts_{args.year}.csv"
+    base.assign(dem_win_prob=wins / args.draws).to_csv(fout, index=False)
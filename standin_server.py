@@ -0,0 +1,128 @@
+## Local stand-in for the data source servers, serving recorded fixtures.
+##
+##   python fetch.py --source record          # once, with network
+##   python standin_server.py --latency 0.2 --fail-rate 0.1 &
+##   python fetch.py --standin http://localhost:8800 --rerun
+##
+## Requests for {server}/https/host/path?query are answered with the
+## fixture downloader recorded for https://host/path?query, with optional
+## latency and injected failures (to exercise the retries).  ETag and
+## Range/If-Range requests are honoured like the real servers, so the
+## conditional and resumed download paths can be tested too.
+##
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import downloader
+
+# set from the command line
+latency = 0.0
+jitter = 0.0
+fail_rate = 0.0
+fail_status = 503
+verbose = False
+
+_random = random.Random()
+_random_lock = threading.Lock()
+
+
+def chance():
+    with _random_lock:
+        return _random.random()
+
+
+# original url of a request path: /https/host/path?query
+def original_url(path):
+    scheme, _, rest = path.lstrip('/').partition('/')
+    return f"{scheme}://{rest}"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        delay = latency + jitter * chance()
+        if delay > 0:
+            time.sleep(delay)
+        if fail_rate > 0 and chance() < fail_rate:
+            self.send_error(fail_status)
+            return
+
+        url = original_url(self.path)
+        fname = f"{downloader.fixture_dir}{downloader.fixture_name(url)}"
+        if not os.path.exists(f"{fname}.json"):
+            self.send_error(404, f"no fixture for {url}")
+            return
+        with open(f"{fname}.json", 'r') as infile:
+            meta = json.load(infile)
+        with open(f"{fname}.body", 'rb') as infile:
+            body = infile.read()
+        headers = dict(meta['headers'])
+        if 'ETag' not in headers:
+            headers['ETag'] = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self.send_response(304)
+            self.send_header('ETag', headers['ETag'])
+            self.end_headers()
+            return
+
+        status = meta['status']
+        start = 0
+        byte_range = self.headers.get('Range', "")
+        if byte_range.startswith("bytes=") and byte_range.endswith("-") and \
+           self.headers.get('If-Range') in [headers['ETag'], headers.get('Last-Modified')]:
+            start = int(byte_range[len("bytes="):-1])
+            if start >= len(body):
+                # like the real servers, nothing left to send
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', "0")
+                self.end_headers()
+                return
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{len(body)-1}/{len(body)}"
+
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def log_message(self, format, *args):
+        if verbose:
+            super().log_message(format, *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded fixtures in place of the data sources")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--fixtures", default=downloader.fixture_dir,
+                        help="directory of recorded fixtures, include trailing /")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="up to this many more seconds, at random")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="fraction of requests answered with --fail-status")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+    downloader.fixture_dir = args.fixtures
+    latency = args.latency
+    jitter = args.jitter
+    fail_rate = args.fail_rate
+    fail_status = args.fail_status
+    verbose = args.verbose
+    _random.seed(args.seed)
+
+    server = ThreadingHTTPServer(("", args.port), StandinHandler)
+    print(f"Serving {args.fixtures} on http://localhost:{args.port}")
+    server.serve_forever()